@@ -50,6 +50,44 @@ SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://user-service:8000/api/user')
 PRODUCT_SERVICE_URL = os.getenv('PRODUCT_SERVICE_URL', 'http://product-service:8001/api/product')
 ORDER_SERVICE_URL = os.getenv('ORDER_SERVICE_URL', 'http://localhost:8003/api/orders')
+# Secret chung giữa các service, gửi qua header 'Service-Token' khi gọi các API nội bộ (http-metrics).
+# Để trống thì các API này từ chối mọi request
+SERVICE_AUTH_TOKEN = os.getenv('SERVICE_AUTH_TOKEN', '')
+
+# Xác thực token tại chỗ (services/tokens.py): khoá giống JWT_SIGNING_KEY của User Service (HS256)
+# hoặc public key khi dùng RS256. Để trống thì mỗi request vẫn gọi sang User Service như trước
+JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+JWT_VERIFYING_KEY = os.getenv('JWT_VERIFYING_KEY') or os.getenv('JWT_SIGNING_KEY')
+# Số giây giữ token đã xác thực trong bộ nhớ (0 = tắt)
+JWT_CACHE_TTL = int(os.getenv('JWT_CACHE_TTL', 30))
+# Số request batch tới Product Service chạy song song khi giỏ hàng lớn
+PRODUCT_FETCH_CONCURRENCY = int(os.getenv('PRODUCT_FETCH_CONCURRENCY', 4))
+# Cache snapshot product (services/product_cache.py): dùng luôn trong PRODUCT_CACHE_TTL giây, sau đó vẫn trả về
+# bản cũ và làm mới ở background cho tới PRODUCT_CACHE_STALE_TTL giây. PRODUCT_CACHE_DB=1 để lưu thêm vào Postgres
+PRODUCT_CACHE_TTL = int(os.getenv('PRODUCT_CACHE_TTL', 60))
+PRODUCT_CACHE_STALE_TTL = int(os.getenv('PRODUCT_CACHE_STALE_TTL', 600))
+PRODUCT_CACHE_MAX_SIZE = int(os.getenv('PRODUCT_CACHE_MAX_SIZE', 10000))
+PRODUCT_CACHE_DB = os.getenv('PRODUCT_CACHE_DB', '0') == '1'
+# Thời gian tối đa (giây) chờ request khác đang lấy cùng product, số thread làm mới snapshot ở background
+PRODUCT_CACHE_WAIT_TIMEOUT = float(os.getenv('PRODUCT_CACHE_WAIT_TIMEOUT', 3))
+PRODUCT_CACHE_REFRESH_WORKERS = int(os.getenv('PRODUCT_CACHE_REFRESH_WORKERS', 2))
+
+# HTTP client gọi sang service khác (services/http_client.py)
+# Timeout (connect, read) tính bằng giây cho từng endpoint
+HTTP_CLIENT_TIMEOUTS = {
+    'default': (1, 5),
+    'user': (1, float(os.getenv('USER_SERVICE_TIMEOUT', 3))),
+    'product': (1, float(os.getenv('PRODUCT_SERVICE_TIMEOUT', 3))),
+    'order': (1, float(os.getenv('ORDER_SERVICE_TIMEOUT', 10))),
+}
+# Số connection keep-alive tối đa giữ lại cho mỗi host
+HTTP_CLIENT_POOL_SIZE = int(os.getenv('HTTP_CLIENT_POOL_SIZE', 20))
+# Số lần retry GET khi lỗi kết nối / timeout / 502-504, thời gian chờ cơ sở (giây) trước khi nhân jitter
+HTTP_CLIENT_RETRIES = int(os.getenv('HTTP_CLIENT_RETRIES', 2))
+HTTP_CLIENT_BACKOFF = float(os.getenv('HTTP_CLIENT_BACKOFF', 0.1))
+# Circuit breaker: mở sau N lỗi liên tiếp, sau RESET_TIMEOUT giây cho 1 request thử
+HTTP_CLIENT_FAILURE_THRESHOLD = int(os.getenv('HTTP_CLIENT_FAILURE_THRESHOLD', 5))
+HTTP_CLIENT_RESET_TIMEOUT = float(os.getenv('HTTP_CLIENT_RESET_TIMEOUT', 30))
 # Application definition
 
 INSTALLED_APPS = [
@@ -3,6 +3,8 @@ from django.conf import settings
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 
+from . import http_client, tokens
+
 
 class UserServiceAuthentication(BaseAuthentication):
     def authenticate(self, request):
@@ -10,13 +12,19 @@ class UserServiceAuthentication(BaseAuthentication):
         if not auth_header or not auth_header.startswith("Bearer "):
             return None  # Không có token, bỏ qua xác thực
 
+        # Token do User Service ký có sẵn id / role: tự xác thực, không cần gọi sang User Service
+        if settings.JWT_VERIFYING_KEY:
+            user_data = tokens.verify(auth_header[len("Bearer "):])
+            if user_data is not None:
+                return (user_data, None)
+
         # Gọi sang user microservice để xác thực token
         user_service_url = settings.USER_SERVICE_URL + "/get-user-info"
         try:
-            response = requests.get(
+            response = http_client.get(
+                'user',
                 user_service_url,
                 headers={"Authorization": auth_header},
-                timeout=5  # Thêm timeout để tránh treo request
             )
             response.raise_for_status()  # Ném lỗi nếu không phải 200
         except requests.RequestException as e:
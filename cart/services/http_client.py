@@ -0,0 +1,187 @@
+"""
+HTTP client dùng chung cho mọi lệnh gọi sang service khác (user, product, order):
+- 1 requests.Session cho cả process nên connection được giữ lại (keep-alive) trong pool
+- timeout riêng cho từng endpoint (HTTP_CLIENT_TIMEOUTS)
+- GET được retry có giới hạn, chờ ngẫu nhiên (jitter) giữa các lần
+- circuit breaker cho từng endpoint: lỗi liên tiếp thì báo lỗi ngay thay vì chờ timeout
+"""
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Chỉ retry các method không làm thay đổi dữ liệu
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+RETRY_STATUSES = {502, 503, 504}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Breaker của endpoint đang mở, request không được gửi đi."""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                # Hết thời gian chờ: cho đúng 1 request thử
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_lock = threading.Lock()
+_session = None
+_breakers = {}
+_stats = {}
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=settings.HTTP_CLIENT_POOL_SIZE, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def _endpoint(name):
+    with _lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(settings.HTTP_CLIENT_FAILURE_THRESHOLD, settings.HTTP_CLIENT_RESET_TIMEOUT)
+            _stats[name] = {'requests': 0, 'failures': 0, 'retries': 0, 'short_circuited': 0}
+        return _breakers[name], _stats[name]
+
+
+def _count(stats, key):
+    with _lock:
+        stats[key] += 1
+
+
+def request(method, endpoint, url, **kwargs):
+    """
+    Gửi request tới `url` thuộc `endpoint` ('user', 'product', 'order', ...).
+    Lỗi kết nối / timeout / 5xx tính là lỗi của breaker; 4xx vẫn là service đang sống.
+    Ném CircuitOpenError (là requests.ConnectionError) khi breaker đang mở.
+    """
+    method = method.upper()
+    breaker, stats = _endpoint(endpoint)
+    timeouts = settings.HTTP_CLIENT_TIMEOUTS
+    kwargs.setdefault('timeout', timeouts.get(endpoint, timeouts['default']))
+    attempts = 1 + (settings.HTTP_CLIENT_RETRIES if method in IDEMPOTENT_METHODS else 0)
+
+    for attempt in range(attempts):
+        if not breaker.allow():
+            _count(stats, 'short_circuited')
+            raise CircuitOpenError(f'Circuit breaker của {endpoint} đang mở')
+        _count(stats, 'requests')
+        error = None
+        try:
+            response = _get_session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+            breaker.record_failure()
+            _count(stats, 'failures')
+        except BaseException:
+            # Lỗi khác (vd. ChunkedEncodingError) không retry nhưng vẫn tính là lỗi,
+            # để breaker không kẹt ở HALF_OPEN khi request thử gặp lỗi này
+            breaker.record_failure()
+            _count(stats, 'failures')
+            raise
+        else:
+            if response.status_code >= 500:
+                breaker.record_failure()
+                _count(stats, 'failures')
+            else:
+                breaker.record_success()
+            if response.status_code not in RETRY_STATUSES:
+                return response
+
+        if attempt + 1 < attempts:
+            _count(stats, 'retries')
+            # Full jitter: chờ ngẫu nhiên trong [0, backoff * 2^attempt]
+            time.sleep(random.uniform(0, settings.HTTP_CLIENT_BACKOFF * 2 ** attempt))
+    if error is not None:
+        raise error
+    return response
+
+
+def get(endpoint, url, **kwargs):
+    return request('GET', endpoint, url, **kwargs)
+
+
+def post(endpoint, url, **kwargs):
+    return request('POST', endpoint, url, **kwargs)
+
+
+def metrics():
+    """Số liệu của connection pool và trạng thái breaker của từng endpoint."""
+    pools = []
+    if _session is not None:
+        for adapter in {id(adapter): adapter for adapter in _session.adapters.values()}.values():
+            pool_manager = adapter.poolmanager
+            for key in list(pool_manager.pools.keys()):
+                pool = pool_manager.pools.get(key)
+                if pool is None:
+                    continue
+                # Queue của urllib3 chứa sẵn None cho chỗ chưa mở connection, connection đang dùng thì không nằm trong queue
+                queued = list(pool.pool.queue) if pool.pool else []
+                max_size = pool.pool.maxsize if pool.pool else 0
+                pools.append({
+                    'host': pool.host,
+                    'port': pool.port,
+                    'max_size': max_size,
+                    'in_use': max_size - len(queued),
+                    'idle': sum(1 for connection in queued if connection is not None),
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                })
+    with _lock:
+        endpoints = {
+            name: {**_stats[name], 'breaker': breaker.state, 'consecutive_failures': breaker.failures}
+            for name, breaker in _breakers.items()
+        }
+    return {'pools': pools, 'endpoints': endpoints}
+
+
+def reset():
+    """Đóng pool và xoá breaker / số liệu (dùng khi đổi cấu hình, vd. trong test)."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _breakers.clear()
+        _stats.clear()
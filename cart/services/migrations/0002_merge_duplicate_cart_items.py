@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    """
+    Gộp các dòng trùng (cart, product_id) trước khi thêm unique constraint:
+    giữ dòng có id nhỏ nhất với quantity là tổng của các dòng, xoá các dòng còn lại.
+    """
+    CartItem = apps.get_model('services', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_id')
+        .annotate(rows=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for group in list(duplicates):
+        CartItem.objects.filter(id=group['keep_id']).update(quantity=group['total'])
+        CartItem.objects.filter(cart_id=group['cart_id'], product_id=group['product_id']) \
+            .exclude(id=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+    ]
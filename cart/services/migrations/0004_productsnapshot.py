@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_cartitem_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSnapshot',
+            fields=[
+                ('product_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'product_snapshots',
+            },
+        ),
+    ]
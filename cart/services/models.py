@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connections, models, transaction
 
 class Cart(models.Model):
     id = models.IntegerField(primary_key=True)  # Khớp với user_id từ User Service
@@ -6,11 +6,60 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart {self.id}"
 
+class CartItemManager(models.Manager):
+    def add(self, cart_id, product_id, quantity, max_quantity):
+        """
+        Thêm quantity sản phẩm vào giỏ (tạo cart nếu chưa có) bằng INSERT ... ON CONFLICT DO UPDATE,
+        không đọc item lên rồi mới ghi nên 2 request cùng lúc (double-click) không ghi đè nhau.
+        Trả về số lượng mới, hoặc None nếu tổng vượt max_quantity (stock), khi đó không thay đổi gì.
+        Cart chỉ được tạo sau khi item đã ghi được; khoá ngoại cart_id kiểm tra lúc commit (DEFERRABLE)
+        nên 2 lệnh chạy chung 1 transaction.
+        """
+        if quantity > max_quantity:
+            return None
+        connection = connections[self.db]
+        cart_table = connection.ops.quote_name(Cart._meta.db_table)
+        item_table = connection.ops.quote_name(self.model._meta.db_table)
+        with transaction.atomic(using=self.db, savepoint=False), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {item_table} (cart_id, product_id, quantity) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {item_table}.quantity + EXCLUDED.quantity "
+                f"WHERE {item_table}.quantity + EXCLUDED.quantity <= %s "
+                f"RETURNING quantity",
+                [cart_id, product_id, quantity, max_quantity],
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute(f"INSERT INTO {cart_table} (id) VALUES (%s) ON CONFLICT (id) DO NOTHING", [cart_id])
+        return row[0]
+
+
 class CartItem(models.Model):
     id = models.AutoField(primary_key=True)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product_id = models.IntegerField()
     quantity = models.IntegerField()
 
+    objects = CartItemManager()
+
+    class Meta:
+        constraints = [
+            # Mỗi product chỉ có 1 dòng trong 1 giỏ, cần cho ON CONFLICT của CartItemManager.add
+            models.UniqueConstraint(fields=['cart', 'product_id'], name='unique_cart_product'),
+        ]
+
+    def __str__(self):
+        return f"Item {self.product_id} in Cart {self.cart.id}"
+
+class ProductSnapshot(models.Model):
+    # Bản sao thông tin product lấy từ Product Service (services/product_cache.py), dùng khi bật PRODUCT_CACHE_DB
+    product_id = models.IntegerField(primary_key=True)
+    data = models.JSONField()
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'product_snapshots'
+
     def __str__(self):
-        return f"Item {self.product_id} in Cart {self.cart.id}"
\ No newline at end of file
+        return f"Snapshot of product {self.product_id}"
@@ -0,0 +1,183 @@
+"""
+Cache snapshot product (tên, giá, stock, is_active, ảnh đầu tiên, category) cho giỏ hàng.
+- LRU trong bộ nhớ, tối đa PRODUCT_CACHE_MAX_SIZE product; bật PRODUCT_CACHE_DB thì lưu thêm vào bảng
+  product_snapshots để worker mới khởi động / worker khác dùng lại
+- Snapshot chưa quá PRODUCT_CACHE_TTL giây: dùng luôn
+- Quá TTL nhưng chưa quá PRODUCT_CACHE_STALE_TTL: vẫn trả về, đồng thời làm mới ở background
+  (mỗi id chỉ có 1 lần làm mới trong hàng đợi / đang chạy)
+- Chưa có hoặc quá cũ: gọi Product Service, nhiều request cùng thiếu 1 product chỉ gọi 1 lần (single-flight)
+- Product Service lỗi / chậm: dùng snapshot cũ nếu có, không có thì None
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from . import products
+from .models import ProductSnapshot
+
+SNAPSHOT_FIELDS = ('id', 'name', 'price', 'stock', 'img_url', 'category', 'is_active', 'missing')
+
+_lock = threading.Lock()
+# product_id -> (snapshot, fetched_at), thứ tự từ ít dùng nhất đến dùng gần nhất
+_entries = OrderedDict()
+# product_id -> Event của request đang lấy product đó từ Product Service
+_inflight = {}
+# Id đã được đưa vào executor để làm mới ở background mà chưa chạy xong
+_refreshing = set()
+_executor = None
+
+
+def _snapshot(product):
+    return {field: product[field] for field in SNAPSHOT_FIELDS if field in product}
+
+
+def _store(entries):
+    with _lock:
+        for product_id, entry in entries.items():
+            current = _entries.get(product_id)
+            # Không ghi đè snapshot mới hơn (vd. dữ liệu đọc từ database cũ hơn bản trong bộ nhớ)
+            if current is None or current[1] <= entry[1]:
+                _entries[product_id] = entry
+            _entries.move_to_end(product_id)
+        while len(_entries) > settings.PRODUCT_CACHE_MAX_SIZE:
+            _entries.popitem(last=False)
+
+
+def _lookup(product_ids, now):
+    """Chia id thành: snapshot dùng được, id cần làm mới ở background, id phải lấy ngay."""
+    found, stale, expired = {}, [], []
+    with _lock:
+        for product_id in product_ids:
+            entry = _entries.get(product_id)
+            if entry is None:
+                expired.append(product_id)
+                continue
+            _entries.move_to_end(product_id)
+            snapshot, fetched_at = entry
+            age = now - fetched_at
+            if age <= settings.PRODUCT_CACHE_TTL:
+                found[product_id] = snapshot
+            elif age <= settings.PRODUCT_CACHE_STALE_TTL:
+                found[product_id] = snapshot
+                stale.append(product_id)
+            else:
+                expired.append(product_id)
+    return found, stale, expired
+
+
+def _load_from_db(product_ids):
+    try:
+        # Savepoint như _save_to_db: trên Postgres lệnh đọc lỗi làm hỏng cả transaction của request
+        with transaction.atomic():
+            rows = list(ProductSnapshot.objects.filter(product_id__in=product_ids))
+    except DatabaseError:
+        return
+    _store({row.product_id: (row.data, row.fetched_at.timestamp()) for row in rows})
+
+
+def _save_to_db(snapshots, fetched_at):
+    fetched_at = datetime.fromtimestamp(fetched_at, tz=timezone.utc)
+    try:
+        # Savepoint riêng để lỗi ghi cache không làm hỏng transaction của request
+        with transaction.atomic():
+            ProductSnapshot.objects.bulk_create(
+                [ProductSnapshot(product_id=product_id, data=snapshot, fetched_at=fetched_at)
+                 for product_id, snapshot in snapshots.items()],
+                update_conflicts=True, unique_fields=['product_id'], update_fields=['data', 'fetched_at'],
+            )
+    except DatabaseError:
+        pass
+
+
+def _fetch(product_ids, wait=True):
+    """
+    Lấy các product từ Product Service và ghi vào cache. Id đang được request khác lấy thì
+    chờ kết quả của request đó (tối đa PRODUCT_CACHE_WAIT_TIMEOUT giây) thay vì gọi thêm lần nữa.
+    """
+    with _lock:
+        waiting = [_inflight[product_id] for product_id in product_ids if product_id in _inflight]
+        owned = [product_id for product_id in product_ids if product_id not in _inflight]
+        for product_id in owned:
+            _inflight[product_id] = threading.Event()
+    try:
+        if owned:
+            fetched = {product_id: _snapshot(product) for product_id, product in products.fetch_products(owned).items()}
+            fetched_at = time.time()
+            _store({product_id: (snapshot, fetched_at) for product_id, snapshot in fetched.items()})
+            if fetched and settings.PRODUCT_CACHE_DB:
+                _save_to_db(fetched, fetched_at)
+    finally:
+        with _lock:
+            for product_id in owned:
+                _inflight.pop(product_id).set()
+    if wait:
+        deadline = time.monotonic() + settings.PRODUCT_CACHE_WAIT_TIMEOUT
+        for event in waiting:
+            event.wait(max(0, deadline - time.monotonic()))
+
+
+def _refresh(product_ids):
+    try:
+        _fetch(product_ids, wait=False)
+    finally:
+        with _lock:
+            _refreshing.difference_update(product_ids)
+        # Thread của executor không đi qua request cycle nên tự đóng connection database
+        connection.close()
+
+
+def _submit(function, *args):
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.PRODUCT_CACHE_REFRESH_WORKERS)
+    _executor.submit(function, *args)
+
+
+def get_many(product_ids, allow_stale=True):
+    """
+    {product_id: snapshot}; id chưa từng lấy được (Product Service lỗi) có giá trị None.
+    allow_stale=False: snapshot quá PRODUCT_CACHE_TTL được lấy lại ngay thay vì làm mới ở background,
+    Product Service lỗi thì trả về None thay vì snapshot cũ.
+    """
+    product_ids = set(product_ids)
+    now = time.time()
+    found, stale, expired = _lookup(product_ids, now)
+    if expired and settings.PRODUCT_CACHE_DB:
+        _load_from_db(expired)
+        found_in_db, stale_in_db, expired = _lookup(expired, now)
+        found.update(found_in_db)
+        stale += stale_in_db
+    if not allow_stale:
+        for product_id in stale:
+            del found[product_id]
+        expired += stale
+        stale = []
+    if stale:
+        with _lock:
+            stale = [product_id for product_id in stale if product_id not in _refreshing]
+            _refreshing.update(stale)
+        if stale:
+            _submit(_refresh, stale)
+    if expired:
+        _fetch(expired)
+        now = time.time()
+        with _lock:
+            for product_id in expired:
+                # Product Service lỗi thì dùng snapshot quá hạn còn hơn không có gì (trừ khi allow_stale=False)
+                entry = _entries.get(product_id)
+                usable = entry is not None and (allow_stale or now - entry[1] <= settings.PRODUCT_CACHE_TTL)
+                found[product_id] = entry[0] if usable else None
+    return found
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _refreshing.clear()
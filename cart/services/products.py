@@ -0,0 +1,70 @@
+"""
+Lấy thông tin product từ Product Service cho giỏ hàng: gọi API batch (tối đa BATCH_SIZE id mỗi lần),
+nhiều batch thì gọi song song với số luồng giới hạn.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from . import http_client
+
+# Giới hạn số id mỗi request của API /product/batch
+BATCH_SIZE = 100
+# Chỉ lấy các field giỏ hàng cần hiển thị
+FIELDS = 'id,name,price,stock,img_url,category,is_active'
+
+
+def _fetch_batch(product_ids):
+    try:
+        response = http_client.get(
+            'product',
+            f"{settings.PRODUCT_SERVICE_URL}/batch",
+            params={'ids': ','.join(map(str, product_ids)), 'fields': FIELDS, 'include_inactive': 1},
+            headers={'Cross-Service': 'Cart Service'},
+        )
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError):
+        # Product Service lỗi: bỏ qua, giỏ hàng vẫn hiển thị nhưng thiếu thông tin product
+        return {}
+    products = {product['id']: product for product in data.get('items', [])}
+    for product_id in data.get('missing', []):
+        # Product đã bị xoá hẳn: coi như không còn bán
+        products[product_id] = {'id': product_id, 'is_active': False, 'missing': True}
+    return products
+
+
+def fetch_products(product_ids):
+    """Trả về {product_id: product} cho các id lấy được từ Product Service."""
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    chunks = [product_ids[start:start + BATCH_SIZE] for start in range(0, len(product_ids), BATCH_SIZE)]
+    if len(chunks) == 1:
+        return _fetch_batch(chunks[0])
+    products = {}
+    with ThreadPoolExecutor(max_workers=min(len(chunks), settings.PRODUCT_FETCH_CONCURRENCY)) as executor:
+        for result in executor.map(_fetch_batch, chunks):
+            products.update(result)
+    return products
+
+
+def load_into_context(serializer, product_ids):
+    """
+    Ghi nhớ product đã lấy trong context của serializer gốc (dùng chung cho cả request),
+    chỉ hỏi cache snapshot (product_cache) cho các id chưa có.
+    """
+    # Import trong hàm vì product_cache cũng import module này
+    from . import product_cache
+
+    root = serializer.root
+    products = root._context.get('products')
+    if products is None:
+        products = {}
+        root._context = {**root._context, 'products': products}
+    missing = set(product_ids) - set(products)
+    if missing:
+        # Id không lấy được (Product Service lỗi) có giá trị None để không hỏi lại trong cùng request
+        products.update(product_cache.get_many(missing))
+    return products
@@ -1,39 +1,52 @@
 from rest_framework import serializers
-import requests
-from django.conf import settings
 from .models import Cart, CartItem
+from . import products
+
+
+class CartItemListSerializer(serializers.ListSerializer):
+    """Lấy thông tin product cho cả trang giỏ hàng trong 1 lần gọi batch trước khi serialize từng item."""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        products.load_into_context(self, [item.product_id for item in items])
+        return super().to_representation(items)
+
 
 class CartItemSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='product_id')
-    name = serializers.CharField(source='product.name', read_only=True)
-    price = serializers.FloatField(source='product.price', read_only=True)
-    stock = serializers.IntegerField(source='product.stock', read_only=True)
+    name = serializers.SerializerMethodField()
+    price = serializers.SerializerMethodField()
+    stock = serializers.SerializerMethodField()
     img_url = serializers.SerializerMethodField()
     category = serializers.SerializerMethodField()
-    is_active = serializers.BooleanField(default=True, read_only=True)
+    is_active = serializers.SerializerMethodField()
 
     class Meta:
         model = CartItem
         fields = ['id', 'name', 'price', 'stock', 'img_url', 'category', 'is_active', 'quantity']
+        list_serializer_class = CartItemListSerializer
+
+    def _product(self, obj):
+        return products.load_into_context(self, [obj.product_id]).get(obj.product_id) or {}
+
+    def get_name(self, obj):
+        return self._product(obj).get('name')
+
+    def get_price(self, obj):
+        return self._product(obj).get('price')
+
+    def get_stock(self, obj):
+        return self._product(obj).get('stock')
 
     def get_img_url(self, obj):
-        product_data = self._fetch_product(obj.product_id)
-        if product_data and 'product_image' in product_data and product_data['product_image']:
-            return product_data['product_image'][0]['path']
-        return None
+        return self._product(obj).get('img_url')
 
     def get_category(self, obj):
-        product_data = self._fetch_product(obj.product_id)
-        return product_data.get('category') if product_data else None
-
-    def _fetch_product(self, product_id):
-        try:
-            response = requests.get(f"{settings.PRODUCT_SERVICE_URL}/{product_id}",
-                                    headers={'Cross-Service': 'Cart Service'})
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException:
-            return None
+        return self._product(obj).get('category')
+
+    def get_is_active(self, obj):
+        # Không lấy được thông tin (Product Service lỗi) thì giữ mặc định như trước là True
+        return self._product(obj).get('is_active', True)
 
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
@@ -1,3 +1,418 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import jwt
+import requests
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import http_client, product_cache, tokens
+from .authentications import UserServiceAuthentication
+from .models import Cart, CartItem, ProductSnapshot
+
+
+def batch_response(product_ids, inactive=(), missing=()):
+    response = mock.Mock(status_code=200)
+    response.raise_for_status.return_value = None
+    response.json.return_value = {
+        'items': [
+            {'id': product_id, 'name': f'Product {product_id}', 'price': 10.0, 'stock': 5,
+             'img_url': f'http://media/{product_id}.webp', 'category': {'id': 1, 'name': 'Phone', 'is_active': True},
+             'is_active': product_id not in inactive}
+            for product_id in product_ids if product_id not in missing
+        ],
+        'missing': list(missing),
+        'inactive': list(inactive),
+    }
+    return response
+
+
+class CartHydrationTest(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user={'id': 1})
+        cart = Cart.objects.create(id=1)
+        for product_id in range(1, 21):
+            CartItem.objects.create(cart=cart, product_id=product_id, quantity=1)
+
+    @mock.patch('services.products.http_client.get')
+    def test_page_is_hydrated_with_one_batch_call(self, get):
+        get.side_effect = lambda endpoint, url, params, **kwargs: batch_response(
+            [int(product_id) for product_id in params['ids'].split(',')], inactive=[2], missing=[3])
+        response = self.client.get('/api/cart?per_page=20')
+
+        self.assertEqual(get.call_count, 1)
+        self.assertTrue(get.call_args.args[1].endswith('/batch'))
+        items = {item['id']: item for item in response.data['items']}
+        self.assertEqual(len(items), 20)
+        self.assertEqual((items[1]['name'], items[1]['price'], items[1]['stock']), ('Product 1', 10.0, 5))
+        self.assertEqual(items[1]['img_url'], 'http://media/1.webp')
+        self.assertEqual(items[1]['category']['name'], 'Phone')
+        self.assertFalse(items[2]['is_active'])
+        self.assertFalse(items[3]['is_active'])
+        self.assertIsNone(items[3]['name'])
+
+    @mock.patch('services.products.http_client.get', side_effect=requests.ConnectionError)
+    def test_product_service_down_still_returns_cart(self, get):
+        response = self.client.get('/api/cart?per_page=20')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get.call_count, 1)
+        self.assertIsNone(response.data['items'][0]['price'])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 để server giữ connection (keep-alive) giữa các request
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self):
+        self.server.requests.append((self.command, self.client_address[1]))
+        fault = self.server.faults.pop(0) if self.server.faults else 'ok'
+        if fault == 'slow':
+            time.sleep(0.5)
+        body = b'{}' if fault != 'error' else b'{"error": "unavailable"}'
+        self.send_response(503 if fault == 'error' else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client đã bỏ request (timeout)
+            pass
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(HTTP_CLIENT_RETRIES=2, HTTP_CLIENT_BACKOFF=0, HTTP_CLIENT_FAILURE_THRESHOLD=3,
+                   HTTP_CLIENT_RESET_TIMEOUT=0.2, HTTP_CLIENT_TIMEOUTS={'default': (1, 2), 'product': (1, 0.1)})
+class HttpClientFaultInjectionTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.requests, self.server.faults = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        http_client.reset()
+
+    def tearDown(self):
+        http_client.reset()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_is_retried_on_transient_errors(self):
+        self.server.faults = ['error', 'error']
+        response = http_client.get('order', self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(http_client.metrics()['endpoints']['order']['retries'], 2)
+
+    def test_post_is_not_retried(self):
+        self.server.faults = ['error']
+        response = http_client.post('order', self.url, json={})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_endpoint_timeout(self):
+        self.server.faults = ['slow'] * 3
+        with self.assertRaises(requests.Timeout):
+            http_client.get('product', self.url)
+
+    def test_breaker_opens_then_recovers(self):
+        self.server.faults = ['error'] * 3
+        self.assertEqual(http_client.get('order', self.url).status_code, 503)
+        self.assertEqual(http_client.metrics()['endpoints']['order']['breaker'], 'open')
+
+        # Breaker mở: báo lỗi ngay, không gửi request tới server
+        with self.assertRaises(http_client.CircuitOpenError):
+            http_client.get('order', self.url)
+        self.assertEqual(len(self.server.requests), 3)
+
+        time.sleep(0.25)
+        self.assertEqual(http_client.get('order', self.url).status_code, 200)
+        self.assertEqual(http_client.metrics()['endpoints']['order']['breaker'], 'closed')
+
+    def test_unexpected_error_in_trial_reopens_breaker(self):
+        self.server.faults = ['error'] * 3
+        http_client.get('order', self.url)
+        time.sleep(0.25)
+        error = requests.exceptions.ChunkedEncodingError()
+        with mock.patch.object(http_client._get_session(), 'request', side_effect=error):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                http_client.get('order', self.url)
+        self.assertEqual(http_client.metrics()['endpoints']['order']['breaker'], 'open')
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            http_client.get('order', self.url)
+        self.assertEqual(len({port for _, port in self.server.requests}), 1)
+        pool, = http_client.metrics()['pools']
+        self.assertEqual((pool['connections_opened'], pool['requests'], pool['idle'], pool['in_use']), (1, 5, 1, 0))
+
+    @override_settings(SERVICE_AUTH_TOKEN='metrics-secret')
+    def test_metrics_require_service_token(self):
+        url = '/api/cart/http-metrics'
+        self.assertEqual(APIClient(HTTP_CROSS_SERVICE='Product Service').get(url).status_code, 403)
+        response = APIClient(HTTP_SERVICE_TOKEN='metrics-secret').get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('endpoints', response.data)
+
+
+@override_settings(JWT_VERIFYING_KEY='shared-key', JWT_ALGORITHM='HS256', JWT_CACHE_TTL=30)
+class LocalTokenVerificationTest(SimpleTestCase):
+    def setUp(self):
+        tokens.clear_cache()
+        self.addCleanup(tokens.clear_cache)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/api/cart', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return UserServiceAuthentication().authenticate(request)
+
+    def token(self, key='shared-key', expires_in=timedelta(minutes=5), **claims):
+        payload = {'token_type': 'access', 'user_id': 7, 'exp': datetime.now(timezone.utc) + expires_in, **claims}
+        return jwt.encode(payload, key, algorithm='HS256')
+
+    @mock.patch('services.authentications.http_client.get')
+    def test_token_with_claims_is_verified_locally(self, get):
+        user_data, _ = self.authenticate(self.token(id=7, role={'id': 1, 'name': 'ADMIN'}))
+        self.assertEqual((user_data['id'], user_data['role']['name']), (7, 'ADMIN'))
+        get.assert_not_called()
+
+    @mock.patch('services.authentications.http_client.get')
+    def test_invalid_tokens_are_rejected(self, get):
+        for token in [self.token(key='other-key', id=7, role={'id': 2, 'name': 'CUSTOMER'}),
+                      self.token(expires_in=timedelta(minutes=-1), id=7, role={'id': 2, 'name': 'CUSTOMER'}),
+                      self.token(token_type='refresh', id=7, role={'id': 2, 'name': 'CUSTOMER'})]:
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+        get.assert_not_called()
+
+    @mock.patch('services.authentications.http_client.get')
+    def test_old_token_falls_back_to_user_service(self, get):
+        get.return_value = mock.Mock(status_code=200, **{'json.return_value': {'id': 7, 'role': {'name': 'CUSTOMER'}}})
+        user_data, _ = self.authenticate(self.token())
+        self.assertEqual(user_data['id'], 7)
+        self.assertEqual(get.call_count, 1)
+
+    def test_verified_token_is_cached(self):
+        token = self.token(id=7, role={'id': 2, 'name': 'CUSTOMER'})
+        with mock.patch('services.tokens.jwt.decode', wraps=jwt.decode) as decode:
+            self.authenticate(token)
+            self.authenticate(token)
+        self.assertEqual(decode.call_count, 1)
+
+
+def snapshot(product_id, price=10.0):
+    return {'id': product_id, 'name': f'Product {product_id}', 'price': price, 'stock': 5, 'is_active': True}
+
+
+@override_settings(PRODUCT_CACHE_TTL=60, PRODUCT_CACHE_STALE_TTL=600, PRODUCT_CACHE_MAX_SIZE=100, PRODUCT_CACHE_DB=False)
+class ProductSnapshotCacheTest(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        self.addCleanup(product_cache.clear)
+        # Chạy việc làm mới ở background ngay sau khi request xong để test không phụ thuộc thread
+        self.refreshes = []
+        patcher = mock.patch.object(product_cache, '_submit', lambda function, *args: self.refreshes.append((function, args)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def age(self, product_id, seconds):
+        snapshot_, fetched_at = product_cache._entries[product_id]
+        product_cache._entries[product_id] = (snapshot_, fetched_at - seconds)
+
+    def run_refreshes(self):
+        for function, args in self.refreshes:
+            function(*args)
+        self.refreshes = []
+
+    @mock.patch('services.products.fetch_products')
+    def test_fresh_snapshot_is_served_from_memory(self, fetch):
+        fetch.side_effect = lambda ids: {product_id: snapshot(product_id) for product_id in ids}
+        product_cache.get_many([1, 2])
+        self.assertEqual(product_cache.get_many([1, 2])[2]['name'], 'Product 2')
+        self.assertEqual(fetch.call_count, 1)
+
+    @mock.patch('services.products.fetch_products')
+    def test_stale_snapshot_is_served_while_revalidating(self, fetch):
+        fetch.return_value = {1: snapshot(1, price=10.0)}
+        product_cache.get_many([1])
+        self.age(1, 120)
+
+        fetch.return_value = {1: snapshot(1, price=12.0)}
+        self.assertEqual(product_cache.get_many([1])[1]['price'], 10.0)
+        self.assertEqual(fetch.call_count, 1)
+        self.run_refreshes()
+        self.assertEqual(product_cache.get_many([1])[1]['price'], 12.0)
+
+    @mock.patch('services.products.fetch_products')
+    def test_stale_id_is_queued_for_refresh_once(self, fetch):
+        fetch.return_value = {1: snapshot(1)}
+        product_cache.get_many([1])
+        self.age(1, 120)
+        for _ in range(3):
+            product_cache.get_many([1])
+        self.assertEqual(len(self.refreshes), 1)
+        self.run_refreshes()
+        self.age(1, 120)
+        product_cache.get_many([1])
+        self.assertEqual(len(self.refreshes), 1)
+
+    @mock.patch('services.products.fetch_products')
+    def test_add_to_cart_does_not_trust_stale_snapshot(self, fetch):
+        fetch.return_value = {1: snapshot(1)}
+        product_cache.get_many([1])
+        self.age(1, 120)
+        fetch.return_value = {1: {**snapshot(1), 'stock': 0}}
+        client = APIClient()
+        client.force_authenticate(user={'id': 1})
+        self.assertEqual(client.post('/api/cart', {'id': 1, 'quantity': 1}, format='json').status_code, 400)
+        self.assertEqual(self.refreshes, [])
+
+        # Product Service lỗi: không thêm vào giỏ theo snapshot cũ
+        self.age(1, 120)
+        fetch.return_value = {}
+        self.assertEqual(client.post('/api/cart', {'id': 1, 'quantity': 1}, format='json').status_code, 503)
+
+    @mock.patch('services.products.fetch_products')
+    def test_expired_snapshot_is_used_when_product_service_fails(self, fetch):
+        fetch.return_value = {1: snapshot(1)}
+        product_cache.get_many([1])
+        self.age(1, 1200)
+
+        fetch.return_value = {}
+        result = product_cache.get_many([1, 2])
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(result[1]['name'], 'Product 1')
+        self.assertIsNone(result[2])
+
+    @mock.patch('services.products.fetch_products')
+    def test_concurrent_misses_share_one_fetch(self, fetch):
+        release = threading.Event()
+
+        def slow_fetch(ids):
+            release.wait(2)
+            return {product_id: snapshot(product_id) for product_id in ids}
+        fetch.side_effect = slow_fetch
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(product_cache.get_many([1])[1])) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual([result['name'] for result in results], ['Product 1'] * 5)
+
+    @override_settings(PRODUCT_CACHE_MAX_SIZE=2)
+    @mock.patch('services.products.fetch_products')
+    def test_least_recently_used_snapshot_is_evicted(self, fetch):
+        fetch.side_effect = lambda ids: {product_id: snapshot(product_id) for product_id in ids}
+        product_cache.get_many([1])
+        product_cache.get_many([2])
+        product_cache.get_many([1])
+        product_cache.get_many([3])
+        self.assertEqual(list(product_cache._entries), [1, 3])
+
+    @override_settings(PRODUCT_CACHE_DB=True)
+    @mock.patch('services.products.fetch_products')
+    def test_snapshots_are_persisted_to_database(self, fetch):
+        fetch.return_value = {1: snapshot(1)}
+        product_cache.get_many([1])
+        self.assertEqual(ProductSnapshot.objects.get(product_id=1).data['name'], 'Product 1')
+
+        # Worker khác (bộ nhớ trống) đọc lại từ database, không gọi Product Service
+        product_cache.clear()
+        self.assertEqual(product_cache.get_many([1])[1]['name'], 'Product 1')
+        self.assertEqual(fetch.call_count, 1)
+
+    @mock.patch('services.products.fetch_products')
+    def test_add_to_cart_uses_snapshot(self, fetch):
+        fetch.return_value = {1: snapshot(1), 2: {'id': 2, 'is_active': False, 'missing': True}}
+        client = APIClient()
+        client.force_authenticate(user={'id': 1})
+        self.assertEqual(client.post('/api/cart', {'id': 1, 'quantity': 2}, format='json').status_code, 200)
+        self.assertEqual(client.post('/api/cart', {'id': 1, 'quantity': 2}, format='json').status_code, 200)
+        self.assertEqual(client.post('/api/cart', {'id': 1, 'quantity': 2}, format='json').status_code, 400)
+        self.assertEqual(CartItem.objects.get(cart_id=1, product_id=1).quantity, 4)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(client.post('/api/cart', {'id': 2, 'quantity': 1}, format='json').status_code, 404)
+
+
+class CartUpsertTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user={'id': 1})
+
+    def test_get_does_not_create_cart(self):
+        response = self.client.get('/api/cart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_add_inserts_then_increments(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(CartItem.objects.add(1, 10, 2, max_quantity=5), 2)
+        self.assertEqual(CartItem.objects.add(1, 10, 3, max_quantity=5), 5)
+        # Vượt stock: không thay đổi số lượng và không ghi gì vào cart
+        with self.assertNumQueries(1):
+            self.assertIsNone(CartItem.objects.add(1, 10, 1, max_quantity=5))
+        self.assertEqual(CartItem.objects.get(cart_id=1, product_id=10).quantity, 5)
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_duplicate_items_are_rejected(self):
+        cart = Cart.objects.create(id=1)
+        CartItem.objects.create(cart=cart, product_id=10, quantity=1)
+        with self.assertRaises(IntegrityError):
+            CartItem.objects.create(cart=cart, product_id=10, quantity=1)
+
+    @mock.patch('services.product_cache.get_many', return_value={10: {'id': 10, 'stock': 5, 'is_active': True}})
+    def test_add_to_cart_validates_quantity(self, get_many):
+        self.assertEqual(self.client.post('/api/cart', {'id': 10, 'quantity': -1}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/cart', {'id': 10, 'quantity': 'a'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/cart', {'id': 10, 'quantity': '2'}, format='json').status_code, 200)
+        self.assertEqual(CartItem.objects.get(cart_id=1, product_id=10).quantity, 2)
+
+
+class MergeDuplicateCartItemsMigrationTest(TransactionTestCase):
+    before = [('services', '0001_initial')]
+    after = [('services', '0003_cartitem_unique_cart_product')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        # Đưa database về migration mới nhất để các test sau không phụ thuộc thứ tự chạy
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_summed_before_constraint(self):
+        apps = self.migrate(self.before)
+        OldCart = apps.get_model('services', 'Cart')
+        OldCartItem = apps.get_model('services', 'CartItem')
+        cart = OldCart.objects.create(id=1)
+        first = OldCartItem.objects.create(cart=cart, product_id=10, quantity=1)
+        OldCartItem.objects.create(cart=cart, product_id=10, quantity=2)
+        OldCartItem.objects.create(cart=cart, product_id=11, quantity=4)
+
+        self.migrate(self.after)
+        self.assertEqual(sorted(CartItem.objects.values_list('id', 'product_id', 'quantity')),
+                         [(first.id, 10, 3), (first.id + 2, 11, 4)])
+        with self.assertRaises(IntegrityError):
+            CartItem.objects.create(cart_id=1, product_id=10, quantity=1)
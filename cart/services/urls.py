@@ -5,4 +5,5 @@ urlpatterns = [
     path('cart', views.CartView.as_view(), name='cart'),
     path('cart/<int:product_id>', views.CartItemDeleteView.as_view(), name='cart-item-delete'),
     path('cart/to-order', views.CartToOrderView.as_view(), name='cart-to-order'),
+    path('cart/http-metrics', views.HttpClientMetricsView.as_view(), name='cart-http-metrics'),
 ]
\ No newline at end of file
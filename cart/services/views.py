@@ -1,4 +1,3 @@
-import os
 from http.client import responses
 
 from django.core.paginator import Paginator
@@ -8,9 +7,10 @@ from rest_framework.response import Response
 from rest_framework import status
 import requests
 from django.conf import settings
+from . import http_client, product_cache
 from .models import Cart, CartItem
 from .serializers import CartSerializer, CartItemSerializer
-from .permissions import IsAuth
+from .permissions import IsAuth, IsAuthenticatedService
 
 
 class CartView(APIView):
@@ -20,13 +20,13 @@ class CartView(APIView):
         page = request.query_params.get('page', 1)
         per_page = request.query_params.get('per_page', 10)
         user_id = request.user['id']
-        cart, created = Cart.objects.get_or_create(id=user_id)
-        paginator = Paginator(cart.items.all(), per_page)
+        # Chỉ đọc: user chưa có giỏ hàng thì trả về trang rỗng, không tạo Cart
+        paginator = Paginator(CartItem.objects.filter(cart_id=user_id).order_by('id'), per_page)
         try:
             cart_items = paginator.page(page)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        serializer = CartItemSerializer(cart_items, many=True)
+        serializer = CartItemSerializer(cart_items, many=True, context={'request': request})
 
         response = {
             'items': serializer.data,
@@ -45,17 +45,22 @@ class CartView(APIView):
 
         if not product_id or not quantity:
             return Response({'error': 'Thiếu id hoặc quantity'}, status=status.HTTP_400_BAD_REQUEST)
-
-        cart, created = Cart.objects.get_or_create(id=user_id)
-
-        # Kiểm tra product có tồn tại trong Product Service
         try:
-            response = requests.get(f"{settings.PRODUCT_SERVICE_URL}/{product_id}")
-            if response.status_code != 200:
-                return Response({'error': 'Product không tồn tại'}, status=status.HTTP_404_NOT_FOUND)
-        except requests.RequestException as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        product_data = response.json()
+            product_id = int(product_id)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            return Response({'error': 'Dữ liệu sản phẩm không hợp lệ'}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity < 1:
+            return Response({'error': 'quantity phải lớn hơn 0'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Kiểm tra product có tồn tại, lấy từ cache snapshot (chỉ gọi Product Service khi chưa có / quá TTL).
+        # Không dùng snapshot quá hạn nên stock / is_active cũ tối đa PRODUCT_CACHE_TTL giây: đây chỉ là kiểm tra sơ bộ,
+        # kiểm tra chính xác là lúc giữ hàng (stock reservation) ở Product Service khi đặt hàng
+        product_data = product_cache.get_many([product_id], allow_stale=False)[product_id]
+        if product_data is None:
+            return Response({'error': 'Không lấy được thông tin sản phẩm'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if product_data.get('missing'):
+            return Response({'error': 'Product không tồn tại'}, status=status.HTTP_404_NOT_FOUND)
         # Kiểm tra product có bị ẩn k
         try:
             if not product_data.get('is_active', True):
@@ -65,22 +70,13 @@ class CartView(APIView):
 
         # Kiểm tra stock
         try:
-            if product_data['stock'] < quantity:
-                return Response({'error': 'Không đủ hàng trong kho'}, status=status.HTTP_400_BAD_REQUEST)
-        except (KeyError, ValueError):
+            stock = int(product_data['stock'])
+        except (KeyError, TypeError, ValueError):
             return Response({'error': 'Dữ liệu sản phẩm không hợp lệ'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Kiểm tra xem sản phẩm đã có trong giỏ hàng chưa
-        cart_item, item_created = CartItem.objects.get_or_create(
-            cart=cart, product_id=product_id, defaults={'quantity': quantity}
-        )
-        if not item_created:
-            # Nếu sản phẩm đã có trong giỏ hàng, cập nhật số lượng
-            cart_item.quantity += quantity
-            # Kiểm tra stock trước khi cập nhật
-            if product_data['stock'] < cart_item.quantity:
-                return Response({'error': 'Không đủ hàng trong kho'}, status=status.HTTP_400_BAD_REQUEST)
-            cart_item.save()
+        # Thêm mới hoặc cộng dồn số lượng trong 1 câu upsert, chỉ ghi khi tổng không vượt stock
+        if CartItem.objects.add(user_id, product_id, quantity, stock) is None:
+            return Response({'error': 'Không đủ hàng trong kho'}, status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_200_OK)
 
 
@@ -128,8 +124,9 @@ class CartToOrderView(APIView):
 
         # Gọi API Order Service
         try:
-            response = requests.post(
-                os.getenv('ORDER_SERVICE_URL') + '/create',
+            response = http_client.post(
+                'order',
+                settings.ORDER_SERVICE_URL + '/create',
                 json=order_data,
                 headers={'Authorization': request.headers.get('Authorization'), 'Cross-Service': 'Cart Service'}
             )
@@ -143,4 +140,12 @@ class CartToOrderView(APIView):
             CartItem.objects.filter(cart=cart, product_id__in=[i['product_id'] for i in data['items']]).delete()
             return Response(status=status.HTTP_200_OK)
         except Cart.DoesNotExist:
-            return Response({'error': 'Cart không tồn tại'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'error': 'Cart không tồn tại'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class HttpClientMetricsView(APIView):
+    """Số liệu connection pool và circuit breaker của HTTP client trong process này."""
+    permission_classes = [IsAuthenticatedService]
+
+    def get(self, request):
+        return Response(http_client.metrics(), status=status.HTTP_200_OK)
@@ -50,6 +50,65 @@ USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://localhost:8000/api/user
 CART_SERVICE_URL = os.getenv('CART_SERVICE_URL', 'http://localhost:8003/api/cart')
 ORDER_SERVICE_URL = os.getenv('ORDER_SERVICE_URL', 'http://localhost:8004/api/order')
 
+# Xác thực token tại chỗ (services/tokens.py): khoá giống JWT_SIGNING_KEY của User Service (HS256)
+# hoặc public key khi dùng RS256. Để trống thì mỗi request vẫn gọi sang User Service như trước
+JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+JWT_VERIFYING_KEY = os.getenv('JWT_VERIFYING_KEY') or os.getenv('JWT_SIGNING_KEY')
+# Số giây giữ token đã xác thực trong bộ nhớ (0 = tắt)
+JWT_CACHE_TTL = int(os.getenv('JWT_CACHE_TTL', 30))
+
+# HTTP client gọi sang service khác (services/http_client.py)
+# Timeout (connect, read) tính bằng giây cho từng endpoint
+HTTP_CLIENT_TIMEOUTS = {
+    'default': (1, 5),
+    'user': (1, float(os.getenv('USER_SERVICE_TIMEOUT', 3))),
+}
+# Số connection keep-alive tối đa giữ lại cho mỗi host
+HTTP_CLIENT_POOL_SIZE = int(os.getenv('HTTP_CLIENT_POOL_SIZE', 20))
+# Số lần retry GET khi lỗi kết nối / timeout / 502-504, thời gian chờ cơ sở (giây) trước khi nhân jitter
+HTTP_CLIENT_RETRIES = int(os.getenv('HTTP_CLIENT_RETRIES', 2))
+HTTP_CLIENT_BACKOFF = float(os.getenv('HTTP_CLIENT_BACKOFF', 0.1))
+# Circuit breaker: mở sau N lỗi liên tiếp, sau RESET_TIMEOUT giây cho 1 request thử
+HTTP_CLIENT_FAILURE_THRESHOLD = int(os.getenv('HTTP_CLIENT_FAILURE_THRESHOLD', 5))
+HTTP_CLIENT_RESET_TIMEOUT = float(os.getenv('HTTP_CLIENT_RESET_TIMEOUT', 30))
+
+# Khoảng thời gian (giây) mỗi worker kiểm tra lại version của category cache
+CATEGORY_CACHE_CHECK_INTERVAL = float(os.getenv('CATEGORY_CACHE_CHECK_INTERVAL', 1))
+
+# Khoảng thời gian (giây) mỗi worker kiểm tra lại version của collection products (dùng cho ETag)
+PRODUCT_VERSION_CHECK_INTERVAL = float(os.getenv('PRODUCT_VERSION_CHECK_INTERVAL', 1))
+
+# Cache response của trang danh sách sản phẩm. Key chứa version của products trong Mongo nên LocMem
+# vẫn đúng với nhiều worker / process; backend dùng chung (memcached/redis) chỉ giúp tăng tỉ lệ hit.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'product-service'),
+    }
+}
+PRODUCT_LIST_CACHE_TIMEOUT = int(os.getenv('PRODUCT_LIST_CACHE_TIMEOUT', 60))
+PRODUCT_LIST_CACHE_LOCK_TIMEOUT = int(os.getenv('PRODUCT_LIST_CACHE_LOCK_TIMEOUT', 5))
+
+# Các mốc giá (VND) để chia khoảng giá trong facet của trang danh sách sản phẩm
+PRODUCT_PRICE_FACET_BOUNDARIES = [0, 100000, 500000, 1000000, 5000000, 10000000, 20000000, 50000000]
+
+# Feed thay đổi product: event sau lỗ hổng offset cũ hơn mức này (giây) thì bỏ qua lỗ hổng,
+# long-poll chờ tối đa PRODUCT_EVENT_MAX_WAIT giây và kiểm tra lại mỗi PRODUCT_EVENT_POLL_INTERVAL giây
+PRODUCT_EVENT_GAP_GRACE = int(os.getenv('PRODUCT_EVENT_GAP_GRACE', 5))
+PRODUCT_EVENT_MAX_WAIT = int(os.getenv('PRODUCT_EVENT_MAX_WAIT', 30))
+PRODUCT_EVENT_POLL_INTERVAL = float(os.getenv('PRODUCT_EVENT_POLL_INTERVAL', 0.5))
+
+# Số id mỗi worker giữ trước cho product/category/product_image (1 = tắt chế độ hi/lo)
+ID_BLOCK_SIZE = int(os.getenv('ID_BLOCK_SIZE', 1))
+
+# Thời gian (giây) giữ hàng của 1 stock reservation trước khi bị sweeper trả lại
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 900))
+# ttl lớn nhất (giây) mà service gọi tới được yêu cầu cho 1 reservation
+STOCK_RESERVATION_MAX_TTL = int(os.getenv('STOCK_RESERVATION_MAX_TTL', 3600))
+# Secret chung giữa các service, gửi qua header 'Service-Token' khi gọi các API nội bộ (reservation, event feed, http-metrics).
+# Để trống thì các API này từ chối mọi request
+SERVICE_AUTH_TOKEN = os.getenv('SERVICE_AUTH_TOKEN', '')
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -121,6 +180,9 @@ DATABASES = {
     }
 }
 
+# Số connection tối đa trong pool của MongoClient dùng chung (services/repository.py)
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -159,6 +221,13 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Kích thước (px, cạnh dài nhất) của các bản ảnh do worker process_images tạo
+IMAGE_THUMBNAIL_SIZE = int(os.getenv('IMAGE_THUMBNAIL_SIZE', 320))
+IMAGE_LARGE_SIZE = int(os.getenv('IMAGE_LARGE_SIZE', 1600))
+IMAGE_WEBP_QUALITY = int(os.getenv('IMAGE_WEBP_QUALITY', 80))
+# Ảnh PROCESSING lâu hơn mức này (giây) coi như worker đã chết giữa chừng và được xử lý lại
+IMAGE_PROCESSING_TIMEOUT = int(os.getenv('IMAGE_PROCESSING_TIMEOUT', 600))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Counter
+from . import repository
+
+# Version được lưu trong collection counters để mọi worker cùng thấy khi category thay đổi
+VERSION_KEY = 'category_version'
+
+_lock = threading.Lock()
+_state = {
+    'version': None,
+    'categories': {},
+    'checked_at': 0.0,
+}
+
+
+def _stored_version():
+    return Counter.get_current_sequence(VERSION_KEY)
+
+
+def _refresh():
+    """
+    Kiểm tra version trong counters tối đa mỗi CATEGORY_CACHE_CHECK_INTERVAL giây,
+    chỉ load lại bảng categories khi version đổi.
+    """
+    now = time.monotonic()
+    if _state['version'] is not None and now - _state['checked_at'] < settings.CATEGORY_CACHE_CHECK_INTERVAL:
+        return _state['categories']
+    with _lock:
+        if _state['version'] is not None and now - _state['checked_at'] < settings.CATEGORY_CACHE_CHECK_INTERVAL:
+            return _state['categories']
+        version = _stored_version()
+        if version != _state['version']:
+            _state['categories'] = {category.id: category for category in repository.categories()}
+            _state['version'] = version
+        _state['checked_at'] = time.monotonic()
+        return _state['categories']
+
+
+def get_categories():
+    return _refresh()
+
+
+def get_category(category_id):
+    return _refresh().get(category_id)
+
+
+def get_version():
+    _refresh()
+    return _state['version']
+
+
+def get_active_categories():
+    categories = _refresh().values()
+    return sorted((category for category in categories if category.is_active), key=lambda category: category.id)
+
+
+def invalidate():
+    """
+    Gọi sau mỗi lần ghi category: tăng version chung để các worker khác load lại,
+    và xoá cache của worker hiện tại.
+    """
+    Counter.get_next_sequence(VERSION_KEY)
+    with _lock:
+        _state['version'] = None
+        _state['categories'] = {}
+        _state['checked_at'] = 0.0
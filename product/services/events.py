@@ -0,0 +1,109 @@
+"""
+Outbox các thay đổi của product (price, stock, is_active, ...). Mỗi event có offset tăng dần,
+service khác đọc qua API /product/events?after=<offset> để cập nhật cache của mình.
+
+Event được ghi SAU khi product đã lưu và không cùng transaction: process chết giữa 2 bước thì thay đổi
+đó không có event (không đảm bảo at-least-once). Consumer cần thỉnh thoảng đồng bộ lại toàn bộ
+qua /product/export thay vì coi feed là nguồn duy nhất.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ASCENDING
+
+from .models import Counter, Product, ProductEvent, ProductImage
+
+OFFSET_KEY = 'product_event'
+# Các field được ghi vào event khi tạo product mới
+PRODUCT_FIELDS = ['name', 'price', 'description', 'stock', 'category_id', 'is_active']
+
+
+def image_changes(product_id):
+    """Thay đổi ghi vào event khi ảnh của product đổi: path các ảnh hiện tại theo thứ tự upload."""
+    paths = ProductImage.objects.filter(product_id=product_id).order_by('id').values_list('path', flat=True)
+    return {'images': list(paths)}
+
+
+def record(changes_by_product, versions=None):
+    """
+    Ghi event cho mỗi product: {product_id: {field: giá trị mới}}.
+    `versions` ({product_id: version}) nếu caller đã biết, không thì đọc lại version hiện tại.
+    """
+    changes_by_product = {product_id: changes for product_id, changes in changes_by_product.items() if changes}
+    if not changes_by_product:
+        return
+    if versions is None:
+        versions = {
+            product['id']: product.get('version', 0)
+            for product in Product.objects.mongo_find(
+                {'id': {'$in': list(changes_by_product)}}, {'_id': 0, 'id': 1, 'version': 1}
+            )
+        }
+    offsets = Counter.reserve_block(OFFSET_KEY, len(changes_by_product))
+    now = timezone.now()
+    ProductEvent.objects.mongo_insert_many([
+        {
+            'offset': offset,
+            'product_id': product_id,
+            'changes': changes,
+            'version': versions.get(product_id, 0),
+            'created_at': now,
+        }
+        for offset, (product_id, changes) in zip(offsets, changes_by_product.items())
+    ])
+
+
+def _is_recent(created_at, cutoff):
+    # pymongo trả về datetime UTC không có tzinfo
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at, timezone.utc)
+    return created_at > cutoff
+
+
+def read(after, limit):
+    """
+    Các event có offset > after theo thứ tự. Offset được cấp trước khi insert nên có thể có lỗ hổng
+    tạm thời (request khác đã lấy offset nhưng chưa ghi xong): dừng trước lỗ hổng để consumer
+    không bỏ sót, trừ khi event phía sau đã cũ hơn PRODUCT_EVENT_GAP_GRACE giây (offset bị bỏ).
+    """
+    documents = ProductEvent.objects.mongo_find(
+        {'offset': {'$gt': after}}, {'_id': 0}
+    ).sort('offset', ASCENDING).limit(limit)
+    cutoff = timezone.now() - timedelta(seconds=settings.PRODUCT_EVENT_GAP_GRACE)
+    events = []
+    expected = after + 1
+    for document in documents:
+        if document['offset'] != expected and _is_recent(document['created_at'], cutoff):
+            break
+        events.append(document)
+        expected = document['offset'] + 1
+    return events
+
+
+def changed_product_ids(after, batch_size=1000):
+    """
+    Id các product có event với offset > after, tăng dần. Trả về iterator đọc từ cursor của aggregation
+    ($group, allowDiskUse) thay vì distinct để không bị giới hạn 16MB của 1 document kết quả.
+    """
+    cursor = ProductEvent.objects.mongo_aggregate([
+        {'$match': {'offset': {'$gt': after}}},
+        {'$group': {'_id': '$product_id'}},
+        {'$sort': {'_id': ASCENDING}},
+    ], allowDiskUse=True, batchSize=batch_size)
+    try:
+        for document in cursor:
+            yield document['_id']
+    finally:
+        cursor.close()
+
+
+def wait_for(after, limit, timeout):
+    """Long-poll: chờ tối đa `timeout` giây cho tới khi có event mới."""
+    deadline = time.monotonic() + timeout
+    while True:
+        events = read(after, limit)
+        if events or time.monotonic() >= deadline:
+            return events
+        time.sleep(settings.PRODUCT_EVENT_POLL_INTERVAL)
@@ -0,0 +1,118 @@
+from django.conf import settings
+
+from .models import Product
+from . import category_cache
+
+# Các kiểu sắp xếp của trang danh sách, luôn kèm id để thứ tự ổn định
+SORTS = {
+    '': ('id',),
+    'price': ('price', 'id'),
+    # id cùng chiều với price để Mongo đi ngược index (price, id) thay vì sort lại trong bộ nhớ
+    '-price': ('-price', '-id'),
+    'newest': ('-id',),
+}
+
+
+def parse_filters(params):
+    """
+    Đọc các bộ lọc category_id, min_price, max_price, in_stock từ query params.
+    Ném ValueError nếu giá trị không hợp lệ.
+    """
+    filters = {}
+    if params.get('category_id'):
+        filters['category_id'] = int(params['category_id'])
+    if params.get('min_price'):
+        filters['min_price'] = float(params['min_price'])
+    if params.get('max_price'):
+        filters['max_price'] = float(params['max_price'])
+    if params.get('in_stock') in ('1', 'true', 'True'):
+        filters['in_stock'] = True
+    return filters
+
+
+def mongo_match(filters, exclude=None):
+    """
+    Điều kiện $match tương ứng với bộ lọc. `exclude` bỏ đi bộ lọc của chính facet đang tính,
+    để facet vẫn hiện số lượng của các lựa chọn khác (vd. các category khác).
+    """
+    match = {}
+    if 'category_id' in filters and exclude != 'category':
+        match['category_id'] = filters['category_id']
+    if exclude != 'price':
+        price = {}
+        if 'min_price' in filters:
+            price['$gte'] = filters['min_price']
+        if 'max_price' in filters:
+            price['$lte'] = filters['max_price']
+        if price:
+            match['price'] = price
+    if filters.get('in_stock') and exclude != 'stock':
+        match['stock'] = {'$gt': 0}
+    return match
+
+
+def compute_facets(filters, product_ids=None):
+    """
+    Tính số lượng theo category, theo khoảng giá và số sản phẩm còn hàng
+    trong 1 aggregation pipeline ($facet) duy nhất.
+    `product_ids` là kết quả tìm kiếm theo từ khoá (None nếu không tìm kiếm).
+    """
+    base = {'is_active': True}
+    if product_ids is not None:
+        base['id'] = {'$in': list(product_ids)}
+    boundaries = settings.PRODUCT_PRICE_FACET_BOUNDARIES
+    pipeline = [
+        {'$match': base},
+        {'$facet': {
+            'categories': [
+                {'$match': mongo_match(filters, exclude='category')},
+                {'$group': {'_id': '$category_id', 'count': {'$sum': 1}}},
+                {'$sort': {'_id': 1}},
+            ],
+            # Giá dưới boundaries[0] đếm riêng, bucket 'other' chỉ còn các giá từ boundaries[-1] trở lên
+            'below_price_ranges': [
+                {'$match': {**mongo_match(filters, exclude='price'), 'price': {'$lt': boundaries[0]}}},
+                {'$count': 'count'},
+            ],
+            'price_ranges': [
+                {'$match': {**mongo_match(filters, exclude='price'), 'price': {'$gte': boundaries[0]}}},
+                {'$bucket': {
+                    'groupBy': '$price',
+                    'boundaries': boundaries,
+                    'default': 'other',
+                    'output': {'count': {'$sum': 1}},
+                }},
+            ],
+            'in_stock': [
+                {'$match': {**mongo_match(filters, exclude='stock'), 'stock': {'$gt': 0}}},
+                {'$count': 'count'},
+            ],
+            'total': [
+                {'$match': mongo_match(filters)},
+                {'$count': 'count'},
+            ],
+        }},
+    ]
+    result = next(iter(Product.objects.mongo_aggregate(pipeline)), {})
+
+    categories = category_cache.get_categories()
+    price_ranges = []
+    below = result['below_price_ranges'][0]['count'] if result.get('below_price_ranges') else 0
+    if below:
+        price_ranges.append({'min': None, 'max': boundaries[0], 'count': below})
+    for bucket in result.get('price_ranges', []):
+        if bucket['_id'] == 'other':
+            price_ranges.append({'min': boundaries[-1], 'max': None, 'count': bucket['count']})
+        else:
+            upper = boundaries[boundaries.index(bucket['_id']) + 1]
+            price_ranges.append({'min': bucket['_id'], 'max': upper, 'count': bucket['count']})
+    return {
+        'categories': [
+            {'id': group['_id'], 'name': categories[group['_id']].name, 'count': group['count']}
+            for group in result.get('categories', [])
+            if group['_id'] in categories and categories[group['_id']].is_active
+        ],
+        'price_ranges': price_ranges,
+        'in_stock': result['in_stock'][0]['count'] if result.get('in_stock') else 0,
+        'total': result['total'][0]['count'] if result.get('total') else 0,
+    }
@@ -0,0 +1,96 @@
+"""
+Serialize product / category cho các API đọc mà không khởi tạo DRF serializer.
+Mỗi tổ hợp (serializer, ?fields=) có 1 "plan" (danh sách field + hàm lấy giá trị) được cache,
+output giống hệt ProductSerializer / ProductSerializerNotDetail / CategorySerializer
+(kiểm tra bằng parity test trong tests.py).
+"""
+from functools import lru_cache
+
+from .serializers import build_image_url, image_variant_path, prefetch_product_relations
+
+
+def _value(attr, convert):
+    # Giống DRF: None giữ nguyên, còn lại qua to_representation của field tương ứng
+    def get(product, context):
+        value = getattr(product, attr)
+        return None if value is None else convert(value)
+    return get
+
+
+def category_data(category):
+    return {
+        'id': None if category.id is None else int(category.id),
+        'name': None if category.name is None else str(category.name),
+        'is_active': None if category.is_active is None else bool(category.is_active),
+    }
+
+
+def _category(product, context):
+    category = context['categories_by_id'].get(product.category_id)
+    return category_data(category) if category else None
+
+
+def _product_image(product, context):
+    request, variant = context['request'], context['image_variant']
+    return [
+        {'id': int(image.id), 'path': build_image_url(request, image_variant_path(image, variant))}
+        for image in context['images_by_product'].get(product.id, [])
+    ]
+
+
+def _img_url(product, context):
+    images = context['images_by_product'].get(product.id, [])
+    if not images:
+        return None
+    return build_image_url(context['request'], image_variant_path(images[0], context['image_variant']))
+
+
+GETTERS = {
+    'id': _value('id', int),
+    'name': _value('name', str),
+    'price': _value('price', float),
+    'description': _value('description', str),
+    'stock': _value('stock', int),
+    'is_active': _value('is_active', bool),
+    'category': _category,
+    'product_image': _product_image,
+    'img_url': _img_url,
+}
+
+
+@lru_cache(maxsize=None)
+def _plan(field_names, fields):
+    return tuple((name, GETTERS[name]) for name in field_names if fields is None or name in fields)
+
+
+def serialize_products(products, serializer_class, request=None, fields=None, image_variant='thumbnail',
+                       images_by_product=None, categories_by_id=None):
+    """
+    Tương đương serializer_class(products, many=True, context=...).data.
+    Ảnh / category được lấy trong 1 lần cho cả danh sách nếu caller chưa truyền vào.
+    """
+    products = list(products)
+    plan = _plan(tuple(serializer_class.Meta.fields), None if fields is None else frozenset(fields))
+    names = {name for name, _ in plan}
+    if images_by_product is None or categories_by_id is None:
+        images_by_product, categories_by_id = prefetch_product_relations(
+            products,
+            with_images=bool(names & {'product_image', 'img_url'}),
+            with_category='category' in names,
+        )
+    context = {
+        'request': request,
+        'image_variant': image_variant,
+        'images_by_product': images_by_product,
+        'categories_by_id': categories_by_id,
+    }
+    return [{name: get(product, context) for name, get in plan} for product in products]
+
+
+def serialize_product(product, serializer_class, request=None, fields=None):
+    # Trang chi tiết dùng ảnh 'large' giống serializer khi không ở chế độ danh sách
+    return serialize_products([product], serializer_class, request, fields, image_variant='large')[0]
+
+
+def serialize_categories(categories):
+    return [category_data(category) for category in categories]
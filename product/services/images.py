@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ProductImage
+from . import versions
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+
+
+def product_images_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'product_images')
+
+
+def store_upload(upload):
+    """
+    Lưu file upload theo sha256 của nội dung (<2 ký tự đầu>/<hash><đuôi file>).
+    File đã tồn tại thì bỏ qua, nên cùng 1 ảnh upload cho nhiều product chỉ lưu 1 lần.
+    Trả về path tương đối trong product_images.
+    """
+    extension = os.path.splitext(upload.name)[1].lower()
+    os.makedirs(product_images_dir(), exist_ok=True)
+    hasher = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=product_images_dir(), suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in upload.chunks():
+                hasher.update(chunk)
+                destination.write(chunk)
+        digest = hasher.hexdigest()
+        relative_path = f'{digest[:2]}/{digest}{extension}'
+        final_path = os.path.join(product_images_dir(), relative_path)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            # Cập nhật mtime để gc_images không xoá file vừa được tham chiếu lại
+            os.utime(final_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return relative_path
+
+
+def create_product_images(product_id, uploads):
+    """
+    Lưu ảnh upload và tạo ProductImage. Nếu cùng nội dung đã được worker xử lý trước đó
+    thì dùng lại luôn các bản resize, không cần xử lý lại.
+    """
+    for upload in uploads:
+        path = store_upload(upload)
+        processed = ProductImage.objects.filter(path=path, status=ProductImage.READY).first()
+        if processed:
+            ProductImage.create(product_id=product_id, path=path, status=ProductImage.READY,
+                                thumbnail_path=processed.thumbnail_path, large_path=processed.large_path)
+        else:
+            ProductImage.create(product_id=product_id, path=path)
+
+
+def collect_garbage(grace_seconds=3600, dry_run=False):
+    """
+    Xoá các file ảnh (và bản resize) không còn ProductImage nào tham chiếu.
+    Số ProductImage trỏ tới 1 path chính là reference count của file đó.
+    Chỉ xoá file cũ hơn `grace_seconds` để không đụng vào ảnh đang upload dở.
+    Trả về danh sách path đã xoá.
+    """
+    referenced = set()
+    for path, thumbnail_path, large_path in ProductImage.objects.values_list('path', 'thumbnail_path', 'large_path'):
+        referenced.update(p for p in (path, thumbnail_path, large_path) if p)
+
+    root = product_images_dir()
+    cutoff = time.time() - grace_seconds
+    removed = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            full_path = os.path.join(directory, filename)
+            relative_path = os.path.relpath(full_path, root).replace(os.sep, '/')
+            if relative_path in referenced or os.path.getmtime(full_path) > cutoff:
+                continue
+            if not dry_run:
+                os.remove(full_path)
+            removed.append(relative_path)
+    return removed
+
+
+def make_variants(image):
+    """
+    Tạo bản thumbnail và bản large (WebP) cho 1 ProductImage, trả về path tương đối của 2 bản.
+    """
+    stem = os.path.splitext(image.path)[0]
+    os.makedirs(os.path.join(product_images_dir(), VARIANTS_DIR, os.path.dirname(stem)), exist_ok=True)
+
+    variants = {}
+    with Image.open(os.path.join(product_images_dir(), image.path)) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+        for variant, size in (('thumbnail', settings.IMAGE_THUMBNAIL_SIZE), ('large', settings.IMAGE_LARGE_SIZE)):
+            resized = source.copy()
+            resized.thumbnail((size, size))
+            relative_path = f'{VARIANTS_DIR}/{stem}-{variant}.webp'
+            resized.save(os.path.join(product_images_dir(), relative_path), 'WEBP',
+                         quality=settings.IMAGE_WEBP_QUALITY, method=4)
+            variants[variant] = relative_path
+    return variants['thumbnail'], variants['large']
+
+
+def _claimable(cutoff):
+    # PENDING, hoặc PROCESSING mà worker giành nó đã quá hạn (crash / bị kill giữa chừng)
+    return Q(status=ProductImage.PENDING) | Q(status=ProductImage.PROCESSING, claimed_at__lt=cutoff) | \
+        Q(status=ProductImage.PROCESSING, claimed_at__isnull=True)
+
+
+def process_pending(limit=50):
+    """
+    Xử lý tối đa `limit` ảnh đang PENDING. Mỗi ảnh được giành bằng update có điều kiện
+    (PENDING -> PROCESSING, kèm claimed_at) nên nhiều worker có thể chạy song song.
+    Ảnh PROCESSING quá IMAGE_PROCESSING_TIMEOUT giây được giành lại. Trả về số ảnh đã xử lý.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.IMAGE_PROCESSING_TIMEOUT)
+    pending_ids = list(
+        ProductImage.objects.filter(_claimable(cutoff)).order_by('id').values_list('id', flat=True)[:limit]
+    )
+    processed = 0
+    for image_id in pending_ids:
+        claimed = ProductImage.objects.filter(_claimable(cutoff), id=image_id).update(
+            status=ProductImage.PROCESSING, claimed_at=now
+        )
+        if claimed != 1:
+            continue
+        image = ProductImage.objects.get(id=image_id)
+        try:
+            thumbnail_path, large_path = make_variants(image)
+        except Exception:
+            logger.exception('Không xử lý được ảnh %s', image.path)
+            ProductImage.objects.filter(id=image_id).update(status=ProductImage.FAILED)
+            continue
+        ProductImage.objects.filter(id=image_id).update(
+            status=ProductImage.READY, thumbnail_path=thumbnail_path, large_path=large_path
+        )
+        # URL ảnh trong response đổi sang bản resize nên product cũng đổi version
+        versions.bump_products([image.product_id])
+        processed += 1
+    return processed
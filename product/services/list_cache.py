@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import category_cache
+
+# Key của trang danh sách chứa version của category đang lọc hoặc của cả collection (lưu trong Mongo,
+# xem versions.py), nên bump_products ở bất kỳ process nào (web, process_images, sweep_reservations, import_catalog)
+# cũng làm các trang cũ không còn được đọc tới, kể cả khi cache là LocMem riêng của từng worker.
+# Ghi product chỉ bỏ các trang của category chứa nó và các trang không lọc category.
+# Các trang cũ tự hết hạn sau PRODUCT_LIST_CACHE_TIMEOUT.
+
+
+def version_scope(params):
+    """
+    Category mà trang danh sách phụ thuộc vào, None nếu trang phụ thuộc mọi category: không lọc category,
+    hoặc có facets (facet category đếm cả các category khác). Ném ValueError nếu category_id không hợp lệ.
+    """
+    category_id = int(params['category_id']) if params.get('category_id') else None
+    if params.get('facets') in ('1', 'true', 'True'):
+        return None
+    return category_id
+
+
+def cache_key(request, products_version):
+    """
+    Key theo tham số đã chuẩn hoá (category_id, bộ lọc, sort, per_page, page, after, facets, fields) cùng host của request
+    vì URL ảnh trong response là absolute URL, và theo version của products (xem version_scope) / categories.
+    """
+    params = request.query_params
+    category_id = params.get('category_id') or None
+    normalized = ':'.join([
+        str(int(category_id)) if category_id else '',
+        str(int(params.get('per_page', 10))),
+        str(int(params.get('page', 1))),
+        params.get('after', '-') if 'after' in params else '',
+        str(float(params['min_price'])) if params.get('min_price') else '',
+        str(float(params['max_price'])) if params.get('max_price') else '',
+        '1' if params.get('in_stock') in ('1', 'true', 'True') else '',
+        params.get('sort', ''),
+        '1' if params.get('facets') in ('1', 'true', 'True') else '',
+        ','.join(sorted({field.strip() for field in params.get('fields', '').split(',') if field.strip()})),
+    ])
+    return (f'product_list:{request.build_absolute_uri("/")}:{products_version}:'
+            f'{category_cache.get_version()}:{normalized}')
+
+
+def get_or_build(key, build):
+    """
+    Trả về response đã cache, nếu chưa có thì gọi build(). Chỉ 1 request được build cùng lúc
+    cho mỗi key (lock bằng cache.add), các request khác chờ kết quả để tránh cache stampede.
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        return Response(cached)
+
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, timeout=settings.PRODUCT_LIST_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        deadline = time.monotonic() + settings.PRODUCT_LIST_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            cached = cache.get(key)
+            if cached is not None:
+                return Response(cached)
+    try:
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout=settings.PRODUCT_LIST_CACHE_TIMEOUT)
+        return response
+    finally:
+        # Hết thời gian chờ thì tự build nhưng không xoá lock của request đang giữ nó
+        if locked:
+            cache.delete(lock_key)
+
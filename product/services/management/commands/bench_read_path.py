@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.models import Product, ProductImage, Category
+from services import repository
+
+
+class Command(BaseCommand):
+    help = 'So sánh CPU time mỗi thao tác đọc giữa ORM (djongo dịch SQL) và repository (pymongo trực tiếp)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--per-page', type=int, default=20)
+
+    def handle(self, *args, **options):
+        first = Product.objects.order_by('id').values_list('id', flat=True).first()
+        if first is None:
+            raise CommandError('Chưa có product nào, hãy import dữ liệu trước (vd. import_catalog)')
+        per_page = options['per_page']
+        page_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:per_page])
+
+        cases = [
+            ('detail',
+             lambda: Product.objects.get(id=first),
+             lambda: repository.get_product(first)),
+            ('list page',
+             lambda: (Product.objects.filter(is_active__in=[True]).count(),
+                      list(Product.objects.filter(is_active__in=[True]).order_by('id')[:per_page])),
+             lambda: (repository.ProductQuery({'is_active': True}).count(),
+                      repository.ProductQuery({'is_active': True})[:per_page])),
+            ('images',
+             lambda: list(ProductImage.objects.filter(product_id__in=page_ids).order_by('id')),
+             lambda: repository.images_for_products(page_ids)),
+            ('categories',
+             lambda: list(Category.objects.all()),
+             lambda: repository.categories()),
+        ]
+        for label, orm, native in cases:
+            orm_cpu = self._cpu_per_call(orm, options['iterations'])
+            native_cpu = self._cpu_per_call(native, options['iterations'])
+            self.stdout.write(
+                f'{label:<12} orm={orm_cpu * 1000:.3f}ms repository={native_cpu * 1000:.3f}ms '
+                f'({orm_cpu / native_cpu if native_cpu else 0:.1f}x)'
+            )
+
+    def _cpu_per_call(self, func, iterations):
+        # process_time chỉ tính CPU của process, không tính thời gian chờ Mongo trả về
+        func()
+        started = time.process_time()
+        for _ in range(iterations):
+            func()
+        return (time.process_time() - started) / iterations
@@ -0,0 +1,56 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from services.models import SearchToken
+from services import search
+
+# Product id giả bắt đầu từ đây để không đụng vào dữ liệu thật
+FAKE_ID_OFFSET = 10 ** 9
+
+WORDS = [
+    'điện thoại', 'máy tính', 'bảng', 'tai nghe', 'sạc', 'ốp lưng', 'loa', 'chuột', 'bàn phím', 'màn hình',
+    'đồng hồ', 'máy ảnh', 'quạt', 'nồi cơm', 'tủ lạnh', 'áo', 'quần', 'giày', 'túi', 'kính',
+]
+
+
+class Command(BaseCommand):
+    help = 'Đo độ trễ tìm kiếm khi catalog tăng dần (dữ liệu giả, tự xoá sau khi chạy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000')
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        rng = random.Random(0)
+        queries = ['dien thoai', 'may t', 'tai nghe', 'ốp', 'man hinh'] * (options['queries'] // 5 or 1)
+
+        indexed = 0
+        try:
+            for size in sizes:
+                batch = []
+                while indexed < size:
+                    name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {indexed}"
+                    batch.extend((token, FAKE_ID_OFFSET + indexed) for token in search.tokenize(name))
+                    indexed += 1
+                    if len(batch) >= options['batch_size']:
+                        search.insert_tokens(batch)
+                        batch = []
+                if batch:
+                    search.insert_tokens(batch)
+
+                timings = []
+                for query in queries:
+                    started = time.perf_counter()
+                    search.search_product_ids(query)
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f'{size:>9} products: p50={statistics.median(timings):.2f}ms '
+                    f'max={max(timings):.2f}ms'
+                )
+        finally:
+            SearchToken.objects.filter(product_id__gte=FAKE_ID_OFFSET).delete()
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from services.models import Category, Product, ProductImage
+from services.serializers import ProductSerializer, ProductSerializerNotDetail
+from services import fast_serializers
+
+
+class Command(BaseCommand):
+    help = 'So sánh thời gian serialize 1 trang product giữa DRF serializer và fast_serializers (dữ liệu trong bộ nhớ)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        request = APIRequestFactory().get('/api/product')
+        categories_by_id = {category_id: Category(id=category_id, name=f'Category {category_id}')
+                            for category_id in range(1, 6)}
+        products = [
+            Product(id=product_id, name=f'Product {product_id}', price=product_id * 1000.0, description='Mô tả',
+                    category_id=product_id % 5 + 1, stock=product_id % 7, is_active=True, version=1)
+            for product_id in range(1, page_size + 1)
+        ]
+        images_by_product = {
+            product.id: [ProductImage(id=product.id * 3 + index, path=f'aa/{product.id}-{index}.jpg',
+                                      product_id=product.id, thumbnail_path=f'variants/{product.id}-{index}.webp')
+                         for index in range(3)]
+            for product in products
+        }
+
+        for serializer_class in (ProductSerializer, ProductSerializerNotDetail):
+            context = {'request': request, 'images_by_product': images_by_product,
+                       'categories_by_id': categories_by_id}
+
+            def drf():
+                return serializer_class(products, many=True, context=context).data
+
+            def fast():
+                return fast_serializers.serialize_products(
+                    products, serializer_class, request,
+                    images_by_product=images_by_product, categories_by_id=categories_by_id,
+                )
+
+            if JSONRenderer().render(drf()) != JSONRenderer().render(fast()):
+                raise CommandError(f'{serializer_class.__name__}: output khác nhau')
+            drf_time = self._per_call(drf, options['iterations'])
+            fast_time = self._per_call(fast, options['iterations'])
+            self.stdout.write(
+                f'{serializer_class.__name__:<28} {page_size} items: drf={drf_time * 1000:.3f}ms '
+                f'fast={fast_time * 1000:.3f}ms ({drf_time / fast_time:.1f}x)'
+            )
+
+    def _per_call(self, func, iterations):
+        func()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - started) / iterations
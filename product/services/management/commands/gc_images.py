@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from services import images
+
+
+class Command(BaseCommand):
+    help = 'Xoá các file ảnh sản phẩm không còn được ProductImage nào tham chiếu'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=3600,
+                            help='Bỏ qua file mới hơn N giây (ảnh đang upload dở)')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        removed = images.collect_garbage(options['grace'], options['dry_run'])
+        for path in removed:
+            self.stdout.write(path)
+        action = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(removed)} files'))
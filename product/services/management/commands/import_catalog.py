@@ -0,0 +1,214 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.models import Counter, Category, Product, ProductImage, SearchToken
+from services import category_cache, events, search, versions
+
+
+class Command(BaseCommand):
+    help = (
+        'Import catalog từ file CSV/NDJSON theo từng chunk bằng bulk insert. '
+        'Mỗi dòng gồm name, price, description, stock, category (tên) hoặc category_id, '
+        'images (list tên file trong media/product_images, CSV dùng "|" để ngăn cách) và id (tuỳ chọn).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None,
+                            help='Mặc định đoán theo phần mở rộng của file')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', default=None,
+                            help='File checkpoint, mặc định <path>.checkpoint')
+        parser.add_argument('--resume', action='store_true', help='Tiếp tục từ checkpoint của lần chạy trước')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        chunk_size = options['chunk_size']
+
+        checkpoint = {'offset': 0, 'rows': 0, 'skipped': 0, 'duplicates': 0, 'errors': 0, 'pending': []}
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            self._rollback_pending(checkpoint['pending'])
+        elif os.path.exists(checkpoint_path):
+            raise CommandError(f'{checkpoint_path} đã tồn tại, dùng --resume hoặc xoá file checkpoint')
+
+        self.categories_by_name = dict(Category.objects.values_list('name', 'id'))
+
+        started = time.monotonic()
+        imported = 0
+        with open(path, encoding='utf-8', newline='') as f:
+            rows = self._read_rows(f, file_format, checkpoint['offset'])
+            chunk = []
+            for row, offset in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    imported += self._import_chunk(chunk, offset, checkpoint, checkpoint_path)
+                    chunk = []
+                    self._report(imported, started, checkpoint)
+            if chunk:
+                imported += self._import_chunk(chunk, f.tell(), checkpoint, checkpoint_path)
+
+        os.remove(checkpoint_path)
+        self._report(imported, started, checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {checkpoint['rows']} products, skipped {checkpoint['skipped']}, "
+            f"duplicate ids {checkpoint.get('duplicates', 0)}, row errors {checkpoint.get('errors', 0)}"
+        ))
+
+    def _read_rows(self, f, file_format, offset):
+        """
+        Đọc từng dòng bằng readline để f.tell() luôn trỏ đúng vị trí sau bản ghi vừa đọc,
+        nhờ đó checkpoint có thể seek lại chính xác.
+        """
+        if file_format == 'csv':
+            header = next(csv.reader([f.readline()]))
+            if offset:
+                f.seek(offset)
+            for row in csv.reader(iter(f.readline, '')):
+                if row:
+                    yield dict(zip(header, row)), f.tell()
+        else:
+            if offset:
+                f.seek(offset)
+            for line in iter(f.readline, ''):
+                if line.strip():
+                    yield json.loads(line), f.tell()
+
+    def _import_chunk(self, chunk, offset, checkpoint, checkpoint_path):
+        checkpoint.setdefault('duplicates', 0)
+        checkpoint.setdefault('errors', 0)
+        parsed = []
+        seen_ids = set()
+        for row in chunk:
+            try:
+                values = self._parse_row(row)
+            except (KeyError, TypeError, ValueError) as e:
+                checkpoint['errors'] += 1
+                self.stderr.write(f"Row error ({e}): {row}")
+                continue
+            if values['id'] is not None:
+                if values['id'] in seen_ids:
+                    # Id trùng: dòng đầu tiên thắng, giống như id đã được import ở chunk trước
+                    checkpoint['duplicates'] += 1
+                    continue
+                seen_ids.add(values['id'])
+            parsed.append(values)
+
+        existing_ids = set(Product.objects.filter(id__in=list(seen_ids)).values_list('id', flat=True)) if seen_ids else set()
+        rows = []
+        for values in parsed:
+            if values['id'] in existing_ids:
+                checkpoint['skipped'] += 1
+                continue
+            rows.append(values)
+
+        explicit_ids = {values['id'] for values in rows if values['id'] is not None}
+        if explicit_ids:
+            # Counter phải vượt qua id trong file, nếu không Product.create qua API sẽ cấp trùng các id này
+            Counter.advance_to('product', max(explicit_ids))
+        missing_ids = sum(1 for values in rows if values['id'] is None)
+        new_ids = iter(self._allocate_ids(missing_ids, explicit_ids))
+        products = []
+        images = []
+        tokens = []
+        for values in rows:
+            product_id = values['id'] if values['id'] is not None else next(new_ids)
+            product = Product(
+                id=product_id,
+                name=values['name'],
+                price=values['price'],
+                description=values['description'],
+                category_id=self._category_id(values),
+                stock=values['stock'],
+            )
+            products.append(product)
+            tokens.extend((token, product_id) for token in search.tokenize(product.name))
+            images.extend((product_id, path) for path in values['images'])
+
+        # Ghi trước danh sách id sắp insert, nếu bị crash giữa chừng lần --resume sẽ xoá chúng rồi làm lại
+        checkpoint['pending'] = [product.id for product in products]
+        self._save_checkpoint(checkpoint, checkpoint_path)
+
+        image_ids = iter(Counter.reserve_block('product_image', len(images)) if images else ())
+        Product.objects.bulk_create(products)
+        ProductImage.objects.bulk_create(
+            [ProductImage(id=next(image_ids), product_id=product_id, path=path) for product_id, path in images]
+        )
+        search.insert_tokens(tokens)
+        versions.bump_products(category_ids={product.category_id for product in products})
+        events.record({
+            product.id: {field: getattr(product, field) for field in events.PRODUCT_FIELDS} for product in products
+        })
+
+        checkpoint['offset'] = offset
+        checkpoint['rows'] += len(products)
+        checkpoint['pending'] = []
+        self._save_checkpoint(checkpoint, checkpoint_path)
+        return len(products)
+
+    def _allocate_ids(self, count, explicit_ids):
+        """
+        Cấp `count` id mới từ counter, bỏ qua id trùng với id trong file hoặc product đã có
+        (vd. import trước đây với id lớn hơn counter) rồi cấp bù.
+        """
+        ids = []
+        while len(ids) < count:
+            block = list(Counter.reserve_block('product', count - len(ids)))
+            existing = set(Product.objects.filter(id__in=block).values_list('id', flat=True))
+            ids.extend(product_id for product_id in block if product_id not in explicit_ids and product_id not in existing)
+        return ids
+
+    def _parse_row(self, row):
+        """Đọc và kiểm tra 1 dòng, dòng sai (vd. thiếu tên category) ném ValueError và bị bỏ qua."""
+        category_id = int(row['category_id']) if row.get('category_id') not in (None, '') else None
+        category = (row.get('category') or '').strip()
+        if category_id is None and not category:
+            raise ValueError('thiếu category hoặc category_id')
+        paths = row.get('images') or []
+        if isinstance(paths, str):
+            paths = [path for path in paths.split('|') if path]
+        return {
+            'id': int(row['id']) if row.get('id') not in (None, '') else None,
+            'name': row['name'],
+            'price': float(row.get('price') or 0),
+            'description': row.get('description', ''),
+            'stock': int(row.get('stock') or 0),
+            'category_id': category_id,
+            'category': category,
+            'images': paths,
+        }
+
+    def _category_id(self, values):
+        if values['category_id'] is not None:
+            return values['category_id']
+        name = values['category']
+        if name not in self.categories_by_name:
+            category = Category.objects.create(id=Counter.get_next_id('category'), name=name)
+            self.categories_by_name[name] = category.id
+            category_cache.invalidate()
+        return self.categories_by_name[name]
+
+    def _rollback_pending(self, product_ids):
+        if not product_ids:
+            return
+        ProductImage.objects.filter(product_id__in=product_ids).delete()
+        SearchToken.objects.filter(product_id__in=product_ids).delete()
+        Product.objects.filter(id__in=product_ids).delete()
+
+    def _save_checkpoint(self, checkpoint, checkpoint_path):
+        tmp_path = f'{checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    def _report(self, imported, started, checkpoint):
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(f"{checkpoint['rows']} rows imported ({rate:.0f} rows/sec)")
@@ -0,0 +1,93 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from pymongo.errors import OperationFailure
+
+from services.models import Product, ProductImage, SearchToken, StockReservation
+
+
+def hot_queries():
+    """Các truy vấn chính của service, dùng để in query plan với --explain"""
+    return [
+        ('product detail', Product, {'id': 1}, None),
+        ('product list', Product, {'is_active': True}, [('id', 1)]),
+        ('product list by category', Product, {'is_active': True, 'category_id': 1}, [('id', 1)]),
+        ('product list by price', Product, {'is_active': True, 'price': {'$gte': 0}}, [('price', 1), ('id', 1)]),
+        ('images of products', ProductImage, {'product_id': {'$in': [1, 2, 3]}}, None),
+        ('pending images', ProductImage, {'status': ProductImage.PENDING}, [('id', 1)]),
+        ('search token prefix', SearchToken, {'token': {'$regex': '^ao'}}, None),
+        ('expired reservations', StockReservation,
+         {'status': StockReservation.HELD, 'expires_at': {'$lte': timezone.now()}}, None),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Tạo các index Mongo khai báo trong `mongo_indexes` của model. Chạy lại nhiều lần không sao: '
+        'index đã đúng thì bỏ qua, index cùng tên nhưng khác định nghĩa thì tạo lại.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop-unknown', action='store_true',
+                            help='Xoá các index không còn được khai báo (trừ _id_)')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ in ra, không thay đổi gì')
+        parser.add_argument('--explain', action='store_true', help='In query plan của các truy vấn chính')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        for model in apps.get_app_config('services').get_models():
+            declared = getattr(model, 'mongo_indexes', None)
+            if declared is None:
+                continue
+            self._sync(model, declared, options['drop_unknown'], dry_run)
+        if options['explain']:
+            for label, model, query, sort in hot_queries():
+                self.stdout.write(f'{label}: {self._plan(model, query, sort)}')
+
+    def _sync(self, model, declared, drop_unknown, dry_run):
+        table = model._meta.db_table
+        existing = {index['name']: index for index in model.objects.mongo_list_indexes()}
+        declared_names = set()
+        for index in declared:
+            document = index.document
+            name = document['name']
+            declared_names.add(name)
+            keys = list(document['key'].items())
+            unique = document.get('unique', False)
+            current = existing.get(name)
+            if current is not None and list(current['key'].items()) == keys and current.get('unique', False) == unique:
+                self.stdout.write(f'{table}.{name}: ok')
+                continue
+            if current is not None:
+                self.stdout.write(f'{table}.{name}: definition changed, recreating')
+                if not dry_run:
+                    model.objects.mongo_drop_index(name)
+            else:
+                self.stdout.write(f'{table}.{name}: creating')
+            if not dry_run:
+                try:
+                    model.objects.mongo_create_indexes([index])
+                except OperationFailure as e:
+                    # Vd. index unique nhưng dữ liệu đang bị trùng: báo lỗi và tiếp tục với các index khác
+                    self.stderr.write(f'{table}.{name}: {e}')
+
+        if drop_unknown:
+            for name in existing:
+                if name != '_id_' and name not in declared_names:
+                    self.stdout.write(f'{table}.{name}: dropping')
+                    if not dry_run:
+                        model.objects.mongo_drop_index(name)
+
+    def _plan(self, model, query, sort):
+        cursor = model.objects.mongo_find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        stages = []
+        while plan:
+            stage = plan.get('stage', '?')
+            if 'indexName' in plan:
+                stage = f"{stage}({plan['indexName']})"
+            stages.append(stage)
+            plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+        return ' <- '.join(stages)
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from services import images
+
+
+class Command(BaseCommand):
+    help = 'Worker tạo ảnh thumbnail / WebP cho các ảnh sản phẩm mới upload'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Chạy lặp lại sau mỗi N giây khi hết ảnh (0 = chạy 1 lần)')
+        parser.add_argument('--limit', type=int, default=50)
+
+    def handle(self, *args, **options):
+        while True:
+            processed = images.process_pending(options['limit'])
+            if processed:
+                self.stdout.write(f'Processed {processed} images')
+                continue
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from services.models import Product, SearchToken
+from services import search
+
+
+class Command(BaseCommand):
+    help = 'Xây lại inverted index tìm kiếm cho toàn bộ sản phẩm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        SearchToken.objects.all().delete()
+
+        total = 0
+        batch = []
+        for product_id, name in Product.objects.order_by('id').values_list('id', 'name').iterator(chunk_size=batch_size):
+            batch.extend((token, product_id) for token in search.tokenize(name))
+            total += 1
+            if len(batch) >= batch_size:
+                search.insert_tokens(batch)
+                batch = []
+        if batch:
+            search.insert_tokens(batch)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} products'))
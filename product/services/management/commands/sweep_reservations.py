@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from services import reservations
+
+
+class Command(BaseCommand):
+    help = 'Trả lại stock cho các reservation đã hết hạn mà chưa commit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Chạy lặp lại sau mỗi N giây (0 = chạy 1 lần)')
+
+    def handle(self, *args, **options):
+        while True:
+            released = reservations.release_expired()
+            self.stdout.write(f'Released {released} expired reservations')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
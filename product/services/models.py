@@ -1,25 +1,82 @@
+import threading
+
+from django.conf import settings
 from djongo import models
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+
+# Block id mà worker hiện tại đã giữ theo từng counter: {name: [next_id, last_id]}
+_id_blocks = {}
+_id_blocks_lock = threading.Lock()
+
 
 class Counter(models.Model):
     _id = models.CharField(max_length=50, primary_key=True)  # Tên collection (product, category, product_image)
     sequence_value = models.IntegerField(default=0)
 
+    objects = models.DjongoManager()
+
     class Meta:
         db_table = 'counters'
 
     @staticmethod
     def get_next_sequence(name):
-        counter, created = Counter.objects.get_or_create(_id=name, defaults={'sequence_value': 1})
-        if not created:
-            counter.sequence_value += 1
-            counter.save()
-        return counter.sequence_value
+        return Counter.reserve_block(name, 1)[0]
+
+    @staticmethod
+    def reserve_block(name, size):
+        """
+        Tăng counter thêm `size` bằng 1 lệnh find_one_and_update nguyên tử ($inc, upsert)
+        và trả về dãy id vừa được giữ.
+        """
+        counter = Counter.objects.mongo_find_one_and_update(
+            {'_id': name},
+            {'$inc': {'sequence_value': size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        last_id = counter['sequence_value']
+        return range(last_id - size + 1, last_id + 1)
+
+    @staticmethod
+    def advance_to(name, value):
+        """Đẩy counter lên ít nhất `value` ($max nguyên tử) để các id cấp sau không trùng id đã dùng."""
+        Counter.objects.mongo_find_one_and_update({'_id': name}, {'$max': {'sequence_value': value}}, upsert=True)
+
+    @staticmethod
+    def get_current_sequence(name):
+        counter = Counter.objects.mongo_find_one({'_id': name})
+        return counter['sequence_value'] if counter else 0
+
+    @staticmethod
+    def get_next_id(name):
+        """
+        Cấp id cho document mới. Với ID_BLOCK_SIZE > 1 (chế độ hi/lo) mỗi worker giữ
+        sẵn 1 block id và cấp dần từ bộ nhớ, chỉ gọi tới Mongo khi hết block.
+        """
+        block_size = settings.ID_BLOCK_SIZE
+        if block_size <= 1:
+            return Counter.get_next_sequence(name)
+        with _id_blocks_lock:
+            block = _id_blocks.get(name)
+            if block is None or block[0] > block[1]:
+                reserved = Counter.reserve_block(name, block_size)
+                block = _id_blocks[name] = [reserved[0], reserved[-1]]
+            next_id = block[0]
+            block[0] += 1
+            return next_id
 
 class Category(models.Model):
     id = models.IntegerField(primary_key=True)
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
 
+    objects = models.DjongoManager()
+
+    # Index Mongo khai báo cạnh model, tạo bằng lệnh `manage.py mongo_indexes` (migration của djongo không tạo index)
+    mongo_indexes = [
+        IndexModel([('id', ASCENDING)], name='categories_id', unique=True),
+    ]
+
     def __str__(self):
         return self.name
 
@@ -29,7 +86,7 @@ class Category(models.Model):
     @classmethod
     def create(cls, **kwargs):
         if 'id' not in kwargs or kwargs['id'] is None:
-            kwargs['id'] = Counter.get_next_sequence('category')
+            kwargs['id'] = Counter.get_next_id('category')
         if cls.objects.filter(id=kwargs['id']).exists():
             raise ValueError(f"ID {kwargs['id']} đã tồn tại")
         return cls.objects.create(**kwargs)
@@ -42,6 +99,21 @@ class Product(models.Model):
     category_id = models.IntegerField()
     stock = models.IntegerField()
     is_active = models.BooleanField(default=True)
+    # Tăng mỗi khi product thay đổi (sửa thông tin, stock, ảnh), dùng làm ETag
+    version = models.IntegerField(default=0)
+
+    objects = models.DjongoManager()
+
+    mongo_indexes = [
+        IndexModel([('id', ASCENDING)], name='products_id', unique=True),
+        # Trang danh sách: lọc active / category, sort theo id (newest đi ngược index) hoặc theo giá
+        IndexModel([('is_active', ASCENDING), ('category_id', ASCENDING), ('id', ASCENDING)],
+                   name='products_active_category_id'),
+        IndexModel([('is_active', ASCENDING), ('category_id', ASCENDING), ('price', ASCENDING), ('id', ASCENDING)],
+                   name='products_active_category_price'),
+        IndexModel([('is_active', ASCENDING), ('price', ASCENDING), ('id', ASCENDING)],
+                   name='products_active_price'),
+    ]
 
     def __str__(self):
         return self.name
@@ -52,15 +124,36 @@ class Product(models.Model):
     @classmethod
     def create(cls, **kwargs):
         if 'id' not in kwargs or kwargs['id'] is None:
-            kwargs['id'] = Counter.get_next_sequence('product')
+            kwargs['id'] = Counter.get_next_id('product')
         if cls.objects.filter(id=kwargs['id']).exists():
             raise ValueError(f"ID {kwargs['id']} đã tồn tại")
         return cls.objects.create(**kwargs)
 
 class ProductImage(models.Model):
+    PENDING = 'PENDING'
+    PROCESSING = 'PROCESSING'
+    READY = 'READY'
+    FAILED = 'FAILED'
+
     id = models.IntegerField(primary_key=True)
     path = models.CharField(max_length=255)
     product_id = models.IntegerField()
+    # Các bản resize (WebP) do worker process_images tạo, rỗng khi chưa xử lý xong
+    status = models.CharField(max_length=20, default=PENDING)
+    thumbnail_path = models.CharField(max_length=255, blank=True, default='')
+    large_path = models.CharField(max_length=255, blank=True, default='')
+    # Thời điểm worker giành ảnh (PROCESSING), quá IMAGE_PROCESSING_TIMEOUT thì worker khác được giành lại
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = models.DjongoManager()
+
+    mongo_indexes = [
+        IndexModel([('id', ASCENDING)], name='product_images_id', unique=True),
+        IndexModel([('product_id', ASCENDING)], name='product_images_product_id'),
+        # Tìm bản đã xử lý theo content hash và hàng đợi của worker process_images
+        IndexModel([('path', ASCENDING), ('status', ASCENDING)], name='product_images_path_status'),
+        IndexModel([('status', ASCENDING), ('id', ASCENDING)], name='product_images_status_id'),
+    ]
 
     def __str__(self):
         return self.path
@@ -71,7 +164,76 @@ class ProductImage(models.Model):
     @classmethod
     def create(cls, **kwargs):
         if 'id' not in kwargs or kwargs['id'] is None:
-            kwargs['id'] = Counter.get_next_sequence('product_image')
+            kwargs['id'] = Counter.get_next_id('product_image')
         if cls.objects.filter(id=kwargs['id']).exists():
             raise ValueError(f"ID {kwargs['id']} đã tồn tại")
-        return cls.objects.create(**kwargs)
\ No newline at end of file
+        return cls.objects.create(**kwargs)
+
+class SearchToken(models.Model):
+    # Inverted index cho tìm kiếm sản phẩm: mỗi document là 1 token (đã bỏ dấu) của tên 1 product
+    _id = models.ObjectIdField()
+    token = models.CharField(max_length=64)
+    product_id = models.IntegerField()
+
+    objects = models.DjongoManager()
+
+    # token đứng đầu để tìm theo prefix (regex ^...) vẫn dùng được index
+    mongo_indexes = [
+        IndexModel([('token', ASCENDING), ('product_id', ASCENDING)], name='product_search_tokens_token'),
+        IndexModel([('product_id', ASCENDING)], name='product_search_tokens_product_id'),
+    ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.product_id}"
+
+    class Meta:
+        db_table = 'product_search_tokens'
+
+
+class StockReservation(models.Model):
+    HELD = 'HELD'
+    COMMITTED = 'COMMITTED'
+    RELEASED = 'RELEASED'
+    EXPIRED = 'EXPIRED'
+
+    id = models.IntegerField(primary_key=True)
+    product_id = models.IntegerField()
+    quantity = models.IntegerField()
+    status = models.CharField(max_length=20, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = models.DjongoManager()
+
+    mongo_indexes = [
+        IndexModel([('id', ASCENDING)], name='stock_reservations_id', unique=True),
+        # Job sweep_reservations tìm các reservation HELD đã quá hạn
+        IndexModel([('status', ASCENDING), ('expires_at', ASCENDING)], name='stock_reservations_status_expires_at'),
+    ]
+
+    def __str__(self):
+        return f"Reservation {self.id}: {self.quantity} x product {self.product_id} ({self.status})"
+
+    class Meta:
+        db_table = 'stock_reservations'
+
+
+class ProductEvent(models.Model):
+    # Outbox các thay đổi của product cho service khác (vd. cart) đọc lần lượt theo offset
+    offset = models.IntegerField(primary_key=True)
+    product_id = models.IntegerField()
+    changes = models.JSONField(default=dict)  # {field: giá trị mới}
+    version = models.IntegerField(default=0)
+    created_at = models.DateTimeField()
+
+    objects = models.DjongoManager()
+
+    mongo_indexes = [
+        IndexModel([('offset', ASCENDING)], name='product_events_offset', unique=True),
+    ]
+
+    def __str__(self):
+        return f"Event {self.offset}: product {self.product_id} v{self.version}"
+
+    class Meta:
+        db_table = 'product_events'
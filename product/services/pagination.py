@@ -0,0 +1,37 @@
+import base64
+
+
+def encode_cursor(last_id):
+    """
+    Cursor là id cuối cùng của trang trước, mã hoá base64 để client coi như chuỗi opaque.
+    """
+    return base64.urlsafe_b64encode(f'id:{last_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        prefix, _, value = base64.urlsafe_b64decode(cursor.encode()).decode().partition(':')
+        if prefix != 'id':
+            raise ValueError
+        return int(value)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def encode_rank_cursor(score, last_id):
+    """
+    Cursor của kết quả tìm kiếm: điểm và id của phần tử cuối trang trước (score = None khi kết quả
+    xếp theo ?sort= thay vì theo thứ hạng). Seek theo (điểm, id) nên product cuối trang bị ẩn / đổi tên
+    cũng không làm trang sau quay về đầu danh sách.
+    """
+    return base64.urlsafe_b64encode(f'rank:{"" if score is None else score}:{last_id}'.encode()).decode()
+
+
+def decode_rank_cursor(cursor):
+    try:
+        prefix, score, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        if prefix != 'rank':
+            raise ValueError
+        return (int(score) if score else None), int(last_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
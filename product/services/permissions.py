@@ -1,4 +1,7 @@
 # your_app/permissions.py
+import hmac
+
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from rest_framework import permissions
 
@@ -37,4 +40,15 @@ class IsCrossServiceCall(permissions.BasePermission):
         # Lấy giá trị của header "SERVICE_AUTH"
         service_auth = request.headers.get("Cross-Service")
         # Kiểm tra xem header có tồn tại và không rỗng
-        return bool(service_auth)
\ No newline at end of file
+        return bool(service_auth)
+
+class IsAuthenticatedService(permissions.BasePermission):
+    """
+    Chỉ cho phép service nội bộ gửi đúng secret settings.SERVICE_AUTH_TOKEN qua header 'Service-Token'.
+    Header 'Cross-Service' ai cũng gửi được (nginx proxy ra ngoài, CORS cho phép) nên không đủ cho API nội bộ.
+    """
+
+    def has_permission(self, request, view):
+        expected = settings.SERVICE_AUTH_TOKEN
+        token = request.headers.get('Service-Token', '')
+        return bool(expected) and hmac.compare_digest(token.encode(), expected.encode())
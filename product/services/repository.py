@@ -0,0 +1,161 @@
+"""
+Đọc product / category / ảnh trực tiếp bằng pymongo cho các API đọc, bỏ qua bước djongo
+parse SQL rồi dịch sang Mongo ở mỗi query. Kết quả vẫn là instance của model nên
+serializer dùng lại được. Các thao tác ghi vẫn đi qua ORM.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connections
+from pymongo import ASCENDING, DESCENDING, MongoClient
+
+from .models import Category, Product, ProductImage
+
+# Chỉ lấy các field serializer cần (projection), bỏ _id. Giữ đúng thứ tự field của model vì from_db cần vậy
+PRODUCT_FIELDS = ['id', 'name', 'price', 'description', 'category_id', 'stock', 'is_active', 'version']
+IMAGE_FIELDS = ['id', 'path', 'product_id', 'status', 'thumbnail_path', 'large_path']
+CATEGORY_FIELDS = ['id', 'name', 'is_active']
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_database():
+    """
+    MongoClient dùng chung cho cả process (pymongo tự giữ connection pool), tạo ở lần gọi đầu.
+    connect=False để an toàn khi server fork worker sau khi import.
+    """
+    global _client
+    database = connections['default'].settings_dict
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(**database.get('CLIENT', {}),
+                                      maxPoolSize=settings.MONGO_MAX_POOL_SIZE, connect=False)
+    return _client[database['NAME']]
+
+
+def _collection(model):
+    return get_database()[model._meta.db_table]
+
+
+def _projection(fields):
+    projection = {field: 1 for field in fields}
+    projection['_id'] = 0
+    return projection
+
+
+def _product_fields(fields):
+    # Giữ thứ tự của PRODUCT_FIELDS, field không load sẽ là deferred trên instance
+    return PRODUCT_FIELDS if fields is None else [field for field in PRODUCT_FIELDS if field in fields]
+
+
+def _build(model, fields, document):
+    # from_db giống ORM: instance được đánh dấu là đã có trong database
+    return model.from_db('default', fields, [document.get(field) for field in fields])
+
+
+def _sort(order):
+    # ('price', '-id') -> [('price', ASCENDING), ('id', DESCENDING)]
+    return [(field.lstrip('-'), DESCENDING if field.startswith('-') else ASCENDING) for field in order]
+
+
+def get_product(product_id, fields=None):
+    """`fields`: chỉ load các field này của product (projection), None = tất cả."""
+    fields = _product_fields(fields)
+    document = _collection(Product).find_one({'id': product_id}, _projection(fields))
+    return _build(Product, fields, document) if document else None
+
+
+def get_product_version(product_id):
+    """Trả về version của product (chỉ đọc 1 field) hoặc None nếu không có product."""
+    document = _collection(Product).find_one({'id': product_id}, {'_id': 0, 'version': 1})
+    if document is None:
+        return None
+    return document.get('version') or 0
+
+
+def products_by_ids(product_ids, fields=None):
+    fields = _product_fields(fields)
+    documents = _collection(Product).find({'id': {'$in': list(product_ids)}}, _projection(fields))
+    return {document['id']: _build(Product, fields, document) for document in documents}
+
+
+def iter_product_batches(match, batch_size):
+    """
+    Duyệt các product theo id bằng 1 cursor phía server, trả về từng list tối đa batch_size product.
+    Chỉ giữ 1 batch trong bộ nhớ nên dùng được cho export toàn bộ catalog.
+    """
+    cursor = _collection(Product).find(match, _projection(PRODUCT_FIELDS)).sort('id', ASCENDING).batch_size(batch_size)
+    try:
+        batch = []
+        for document in cursor:
+            batch.append(_build(Product, PRODUCT_FIELDS, document))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        cursor.close()
+
+
+def images_for_products(product_ids):
+    """Ảnh của nhiều product trong 1 query: {product_id: [ProductImage, ...]} theo thứ tự id."""
+    images_by_product = {product_id: [] for product_id in product_ids}
+    documents = _collection(ProductImage).find(
+        {'product_id': {'$in': list(images_by_product)}}, _projection(IMAGE_FIELDS)
+    ).sort('id', ASCENDING)
+    for document in documents:
+        images_by_product[document['product_id']].append(_build(ProductImage, IMAGE_FIELDS, document))
+    return images_by_product
+
+
+def categories():
+    documents = _collection(Category).find({}, _projection(CATEGORY_FIELDS)).sort('id', ASCENDING)
+    return [_build(Category, CATEGORY_FIELDS, document) for document in documents]
+
+
+class ProductQuery:
+    """
+    Thay cho QuerySet của trang danh sách: count() và slice ([start:stop]) chạy thẳng trên
+    collection products nên dùng được với Paginator.
+    """
+
+    def __init__(self, match, order=('id',), fields=None):
+        self.match = match
+        self.order = tuple(order)
+        self.fields = _product_fields(fields)
+
+    def count(self):
+        return _collection(Product).count_documents(self.match)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('ProductQuery only supports slicing')
+        start = item.start or 0
+        cursor = _collection(Product).find(self.match, _projection(self.fields)).sort(_sort(self.order))
+        if start:
+            cursor = cursor.skip(start)
+        if item.stop is not None:
+            if item.stop <= start:
+                return []
+            cursor = cursor.limit(item.stop - start)
+        return [_build(Product, self.fields, document) for document in cursor]
+
+    def _with_ids(self, product_ids):
+        return {**self.match, 'id': {'$in': list(product_ids)}}
+
+    def ids(self, product_ids):
+        """Các id trong product_ids thoả điều kiện của query, theo thứ tự sort của query."""
+        documents = _collection(Product).find(self._with_ids(product_ids), {'_id': 0, 'id': 1}).sort(_sort(self.order))
+        return [document['id'] for document in documents]
+
+    def in_bulk(self, product_ids):
+        documents = _collection(Product).find(self._with_ids(product_ids), _projection(self.fields))
+        return {document['id']: _build(Product, self.fields, document) for document in documents}
+
+    def seek(self, last_id):
+        """Trang tiếp theo sau last_id khi sort theo id (tăng dần hoặc giảm dần)."""
+        operator = '$lt' if self.order[0] == '-id' else '$gt'
+        return ProductQuery({**self.match, 'id': {operator: last_id}}, self.order, self.fields)
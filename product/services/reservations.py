@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Counter, Product, StockReservation
+from . import events, versions
+
+
+def change_stock(product_id, change):
+    """
+    Cộng/trừ stock bằng 1 lệnh $inc nguyên tử. Khi trừ thì chỉ cập nhật nếu stock còn đủ.
+    Trả về document sau khi cập nhật, hoặc None nếu không có product / không đủ hàng.
+    """
+    condition = {'id': product_id}
+    if change < 0:
+        condition['stock'] = {'$gte': -change}
+    product = Product.objects.mongo_find_one_and_update(condition, {'$inc': {'stock': change, 'version': 1}})
+    if product is not None:
+        versions.bump_products(category_ids=[product.get('category_id')])
+        # product là document trước khi $inc
+        events.record({product_id: {'stock': product['stock'] + change}},
+                      versions={product_id: product.get('version', 0) + 1})
+    return product
+
+
+def reserve(product_id, quantity, ttl=None):
+    """
+    Giữ hàng cho 1 lượt checkout: trừ stock có điều kiện (stock >= quantity) rồi ghi lại reservation
+    có hạn. Trừ stock trước để nếu crash giữa chừng thì chỉ thiếu hàng chứ không bán vượt.
+    """
+    ttl = ttl or settings.STOCK_RESERVATION_TTL
+    product = Product.objects.mongo_find_one_and_update(
+        {'id': product_id, 'is_active': True, 'stock': {'$gte': quantity}},
+        {'$inc': {'stock': -quantity, 'version': 1}},
+    )
+    if product is None:
+        return None
+    versions.bump_products(category_ids=[product.get('category_id')])
+    events.record({product_id: {'stock': product['stock'] - quantity}},
+                  versions={product_id: product.get('version', 0) + 1})
+    return StockReservation.objects.create(
+        id=Counter.get_next_id('stock_reservation'),
+        product_id=product_id,
+        quantity=quantity,
+        expires_at=timezone.now() + timedelta(seconds=ttl),
+    )
+
+
+def commit(reservation_id):
+    # Chuyển HELD -> COMMITTED bằng update có điều kiện, chỉ 1 request thắng
+    return StockReservation.objects.filter(
+        id=reservation_id, status=StockReservation.HELD, expires_at__gt=timezone.now()
+    ).update(status=StockReservation.COMMITTED) == 1
+
+
+def release(reservation_id, status=StockReservation.RELEASED):
+    try:
+        reservation = StockReservation.objects.get(id=reservation_id)
+    except StockReservation.DoesNotExist:
+        return False
+    updated = StockReservation.objects.filter(
+        id=reservation_id, status=StockReservation.HELD
+    ).update(status=status)
+    if updated != 1:
+        return False
+    change_stock(reservation.product_id, reservation.quantity)
+    return True
+
+
+def release_expired():
+    """
+    Trả lại hàng cho các reservation đã quá hạn mà chưa commit. Trả về số reservation đã xử lý.
+    """
+    expired_ids = StockReservation.objects.filter(
+        status=StockReservation.HELD, expires_at__lte=timezone.now()
+    ).values_list('id', flat=True)
+    return sum(1 for reservation_id in list(expired_ids) if release(reservation_id, StockReservation.EXPIRED))
@@ -0,0 +1,123 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+from .models import SearchToken
+
+# Token ngắn hơn mức này chỉ khớp chính xác, tránh prefix quá rộng như "a"
+MIN_PREFIX_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+# Số ứng viên tối đa lấy cho token ít kết quả nhất, giữ độ trễ ổn định khi catalog lớn
+MAX_CANDIDATES = 5000
+
+SearchResult = namedtuple('SearchResult', ['ids', 'truncated', 'scores'])
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def fold(text):
+    """
+    Bỏ dấu tiếng Việt và chuyển về chữ thường: "Điện Thoại" -> "dien thoai".
+    """
+    text = (text or '').lower().replace('đ', 'd')
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN_RE.findall(fold(text)):
+        token = token[:MAX_TOKEN_LENGTH]
+        if token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def insert_tokens(pairs):
+    """
+    Ghi nhiều (token, product_id) bằng insert_many. Không dùng bulk_create vì Django vẫn gửi
+    _id = None cho ObjectIdField, từ document thứ 2 trở đi sẽ bị trùng khoá _id.
+    """
+    documents = [{'token': token, 'product_id': product_id} for token, product_id in pairs]
+    if documents:
+        SearchToken.objects.mongo_insert_many(documents, ordered=False)
+
+
+def index_product(product):
+    SearchToken.objects.filter(product_id=product.id).delete()
+    insert_tokens((token, product.id) for token in tokenize(product.name))
+
+
+def _token_filter(query_token, exact):
+    if exact or len(query_token) < MIN_PREFIX_LENGTH:
+        return {'token': query_token}
+    # Regex prefix có neo ^ được Mongo quét như 1 khoảng trên index (token, product_id)
+    return {'token': {'$regex': '^' + re.escape(query_token)}}
+
+
+def _match_count(query_token):
+    """Số token khớp, chỉ đếm tới MAX_CANDIDATES + 1 nên chi phí có giới hạn."""
+    return SearchToken.objects.mongo_count_documents(_token_filter(query_token, exact=False), limit=MAX_CANDIDATES + 1)
+
+
+def _candidates(query_token):
+    """
+    Tối đa MAX_CANDIDATES ứng viên cho token ít khớp nhất: khớp nguyên token trước, sau đó mới tới khớp prefix,
+    đi theo thứ tự của index nên không phải sort trong bộ nhớ. Trả về ({product_id: score}, truncated).
+    """
+    scores = {}
+    projection = {'_id': 0, 'product_id': 1, 'token': 1}
+    for document in SearchToken.objects.mongo_find({'token': query_token}, projection).limit(MAX_CANDIDATES + 1):
+        scores[document['product_id']] = 2
+    if len(query_token) >= MIN_PREFIX_LENGTH and len(scores) <= MAX_CANDIDATES:
+        prefix = {'token': {'$regex': '^' + re.escape(query_token), '$ne': query_token}}
+        cursor = SearchToken.objects.mongo_find(prefix, projection).limit(MAX_CANDIDATES + 1 - len(scores))
+        for document in cursor:
+            scores.setdefault(document['product_id'], 1)
+    truncated = len(scores) > MAX_CANDIDATES
+    if truncated:
+        # Bỏ ứng viên có điểm thấp nhất (khớp prefix) trước
+        kept = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))[:MAX_CANDIDATES]
+        scores = {product_id: scores[product_id] for product_id in kept}
+    return scores, truncated
+
+
+def _scores_within(query_token, product_ids):
+    scores = {}
+    matches = SearchToken.objects.mongo_find(
+        {**_token_filter(query_token, exact=False), 'product_id': {'$in': list(product_ids)}},
+        {'_id': 0, 'product_id': 1, 'token': 1},
+    )
+    for document in matches:
+        score = 2 if document['token'] == query_token else 1
+        scores[document['product_id']] = max(scores.get(document['product_id'], 0), score)
+    return scores
+
+
+def search(query):
+    """
+    Trả về SearchResult(ids, truncated, scores): các product id khớp với mọi token của query, đã xếp hạng
+    (khớp nguyên token được điểm cao hơn khớp prefix, cùng điểm thì theo id).
+    Token có ít kết quả nhất (đếm có giới hạn) được tra trước để lấy tối đa MAX_CANDIDATES ứng viên,
+    các token còn lại chỉ tra trong tập ứng viên đó nên độ trễ không tăng theo kích thước catalog.
+    truncated = True khi token đó có nhiều kết quả hơn MAX_CANDIDATES, kết quả có thể thiếu.
+    """
+    query_tokens = tokenize(query)
+    if not query_tokens:
+        return SearchResult([], False, {})
+    driver = min(query_tokens, key=lambda query_token: (_match_count(query_token), -len(query_token)))
+    scores, truncated = _candidates(driver)
+    for query_token in query_tokens:
+        if not scores:
+            break
+        if query_token == driver:
+            continue
+        token_scores = _scores_within(query_token, scores)
+        scores = {product_id: score + token_scores[product_id]
+                  for product_id, score in scores.items() if product_id in token_scores}
+    ranked = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+    return SearchResult(ranked, truncated, scores)
+
+
+def search_product_ids(query):
+    return search(query).ids
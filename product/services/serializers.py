@@ -1,10 +1,123 @@
 from rest_framework import serializers
 from django.conf import settings
-import os
-import uuid
+from django.db import models
 from urllib3 import request
 
-from .models import Product, ProductImage, Category
+from .models import Product, ProductImage, Category, StockReservation
+from . import category_cache, events, images, repository, search, versions
+
+
+def prefetch_product_relations(products, with_images=True, with_category=True):
+    """
+    Lấy ảnh cho nhiều product trong 1 query và category từ category cache.
+    Trả về (images_by_product, categories_by_id) để serializer join trong bộ nhớ.
+    Bỏ qua phần không cần khi caller không yêu cầu field tương ứng (?fields=).
+    """
+    if not products:
+        return {}, {}
+    images_by_product = {}
+    if with_images:
+        images_by_product = repository.images_for_products([product.id for product in products])
+
+    categories_by_id = {}
+    if with_category:
+        categories = category_cache.get_categories()
+        category_ids = {product.category_id for product in products}
+        categories_by_id = {category_id: categories[category_id] for category_id in category_ids if category_id in categories}
+    return images_by_product, categories_by_id
+
+
+# Field của serializer cần load thêm field nào của model (không có trong dict = cùng tên)
+SERIALIZER_FIELD_SOURCES = {
+    'category': ['category_id'],
+    'product_image': [],
+    'img_url': [],
+}
+# Luôn load: id để join ảnh, is_active để lọc product ẩn, version cho ETag
+BASE_MODEL_FIELDS = ['id', 'is_active', 'version']
+
+
+def parse_fields(raw, serializer_class):
+    """
+    Đọc tham số ?fields=a,b,c. Trả về None nếu không truyền (lấy tất cả),
+    ném ValueError nếu có field không thuộc serializer.
+    """
+    if not raw:
+        return None
+    fields = {field.strip() for field in raw.split(',') if field.strip()}
+    unknown = fields - set(serializer_class.Meta.fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def model_fields_for(fields):
+    """Các field của Product cần lấy từ database cho danh sách field của serializer (projection)."""
+    if fields is None:
+        return None
+    model_fields = set(BASE_MODEL_FIELDS)
+    for field in fields:
+        model_fields.update(SERIALIZER_FIELD_SOURCES.get(field, [field]))
+    return model_fields
+
+
+def build_image_url(request, path):
+    # Trả về absolute URL cho frontend
+    url = f"{settings.MEDIA_URL}product_images/{path}"
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def image_variant_path(image, variant):
+    """
+    Chọn bản ảnh phù hợp: 'thumbnail' cho trang danh sách, 'large' cho trang chi tiết.
+    Ảnh chưa được worker xử lý xong thì dùng file gốc.
+    """
+    if variant == 'thumbnail' and image.thumbnail_path:
+        return image.thumbnail_path
+    if variant == 'large' and image.large_path:
+        return image.large_path
+    return image.path
+
+
+class ProductListSerializer(serializers.ListSerializer):
+    """
+    Chế độ serialize danh sách: load ảnh của cả trang trong 1 query rồi join trong bộ nhớ,
+    và dùng ảnh thumbnail thay vì ảnh full size.
+    """
+
+    def to_representation(self, data):
+        products = list(data.all() if isinstance(data, models.Manager) else data)
+        if 'image_variant' not in self.context:
+            self.root._context = {**self.root._context, 'image_variant': 'thumbnail'}
+        if 'images_by_product' not in self.context:
+            requested = self.context.get('fields')
+            images_by_product, categories_by_id = prefetch_product_relations(
+                products,
+                with_images=requested is None or bool(requested & {'product_image', 'img_url'}),
+                with_category=requested is None or 'category' in requested,
+            )
+            root = self.root
+            root._context = {
+                **root._context,
+                'images_by_product': images_by_product,
+                'categories_by_id': categories_by_id,
+            }
+        return super().to_representation(products)
+
+
+class SparseFieldsMixin:
+    """Chỉ giữ các field có trong context['fields'] (tham số ?fields=), không có thì giữ tất cả."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        if requested is not None:
+            for name in list(fields):
+                if name not in requested:
+                    fields.pop(name)
+        return fields
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
@@ -15,11 +128,8 @@ class ProductImageSerializer(serializers.ModelSerializer):
         fields = ['id', 'path']
 
     def get_path(self, obj):
-        # Trả về absolute URL cho frontend
-        request = self.context.get('request')
-        if request:
-            return request.build_absolute_uri(f"{settings.MEDIA_URL}product_images/{obj.path}")
-        return f"{settings.MEDIA_URL}product_images/{obj.path}"
+        variant = self.context.get('image_variant', 'large')
+        return build_image_url(self.context.get('request'), image_variant_path(obj, variant))
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -28,7 +138,7 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'is_active']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # product_image = ProductImageSerializer(many=True, read_only=True)
     product_image = serializers.SerializerMethodField()
     category = serializers.SerializerMethodField()
@@ -36,44 +146,63 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'price', 'description', 'product_image', 'stock', 'category', 'is_active']
+        list_serializer_class = ProductListSerializer
 
     def get_product_image(self, obj):
         request = self.context.get('request')
-        images = ProductImage.objects.filter(product_id=obj.id)
-        return ProductImageSerializer(images, many=True, context={'request': request}).data  # Chuyển danh sách ảnh thành JSON
+        images_by_product = self.context.get('images_by_product')
+        if images_by_product is not None:
+            images = images_by_product.get(obj.id, [])
+        else:
+            images = repository.images_for_products([obj.id])[obj.id]
+        context = {'request': request, 'image_variant': self.context.get('image_variant', 'large')}
+        return ProductImageSerializer(images, many=True, context=context).data  # Chuyển danh sách ảnh thành JSON
 
     def get_category(self, obj):
-        try:
-            category = Category.objects.get(id=obj.category_id)
-            return CategorySerializer(category).data
-        except Category.DoesNotExist:
-            return None
+        categories_by_id = self.context.get('categories_by_id')
+        if categories_by_id is not None:
+            category = categories_by_id.get(obj.category_id)
+            return CategorySerializer(category).data if category else None
+        category = category_cache.get_category(obj.category_id)
+        return CategorySerializer(category).data if category else None
 
-class ProductSerializerNotDetail(serializers.ModelSerializer):
+class ProductSerializerNotDetail(SparseFieldsMixin, serializers.ModelSerializer):
     img_url = serializers.SerializerMethodField()
     category = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = ['id', 'name', 'price', 'description', 'img_url', 'stock', 'category', 'is_active']
+        list_serializer_class = ProductListSerializer
 
     def get_category(self, obj):
-        try:
-            category = Category.objects.get(id=obj.category_id)
-            return CategorySerializer(category).data
-        except Category.DoesNotExist:
-            return None
+        categories_by_id = self.context.get('categories_by_id')
+        if categories_by_id is not None:
+            category = categories_by_id.get(obj.category_id)
+            return CategorySerializer(category).data if category else None
+        category = category_cache.get_category(obj.category_id)
+        return CategorySerializer(category).data if category else None
 
     def get_img_url(self, obj):
-        first_image = ProductImage.objects.filter(product_id=obj.id).first()
+        images_by_product = self.context.get('images_by_product')
+        if images_by_product is not None:
+            images = images_by_product.get(obj.id, [])
+            first_image = images[0] if images else None
+        else:
+            images = repository.images_for_products([obj.id])[obj.id]
+            first_image = images[0] if images else None
         if first_image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(f"{settings.MEDIA_URL}product_images/{first_image.path}")
-            return f"{settings.MEDIA_URL}product_images/{first_image.path}"
+            variant = self.context.get('image_variant', 'large')
+            return build_image_url(self.context.get('request'), image_variant_path(first_image, variant))
         return None
 
 
+class StockReservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'product_id', 'quantity', 'status', 'expires_at']
+
+
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
     product_images = serializers.ListField(
         child=serializers.FileField(), write_only=True, required=False
@@ -84,44 +213,45 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'name', 'price', 'description', 'stock', 'category_id', 'product_images']
 
+    def validate_id(self, value):
+        # Khi sửa thì id chỉ được phép trùng với id của product đang sửa
+        if self.instance is not None and value != self.instance.id:
+            raise serializers.ValidationError('id không khớp với product đang sửa')
+        return value
+
     def create(self, validated_data):
         product_images = validated_data.pop('product_images', [])
         try:
             product = Product.create(**validated_data)
         except ValueError as e:
             raise serializers.ValidationError(str(e))
+        search.index_product(product)
 
-        # Lưu ảnh vào media/product_images
-        for image in product_images:
-            # Tạo tên file mới với UUID
-            file_extension = os.path.splitext(image.name)[1]  # Lấy phần mở rộng (.jpg, .png, ...)
-            new_filename = f"{uuid.uuid4().hex}{file_extension}"  # Tạo tên mới bằng UUID
-
-            # file_path = os.path.join(settings.MEDIA_ROOT, 'product_images', image.name)
-            file_path = os.path.join(settings.MEDIA_ROOT, 'product_images', new_filename)
-            # Tạo thư mục nếu chưa tồn tại
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            with open(file_path, 'wb+') as destination:
-                for chunk in image.chunks():
-                    destination.write(chunk)
-            ProductImage.create(product_id=product.id, path=new_filename)
+        images.create_product_images(product.id, product_images)
+        versions.bump_products(category_ids=[product.category_id])
+        events.record({product.id: {field: getattr(product, field) for field in events.PRODUCT_FIELDS}})
         return product
 
     def update(self, instance, validated_data):
         product_images = validated_data.pop('product_images', None)
+        validated_data.pop('id', None)
+        old_category_id = instance.category_id
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        if validated_data:
+            # Chỉ ghi các field được sửa để không ghi đè stock / version do request khác cập nhật
+            instance.save(update_fields=list(validated_data))
+        if 'name' in validated_data:
+            search.index_product(instance)
 
         if product_images is not None:
-            # Xóa ảnh cũ
+            # Xóa ảnh cũ, file sẽ được gc_images dọn nếu không còn product nào dùng
             ProductImage.objects.filter(product_id=instance.id).delete()
-            # Lưu ảnh mới
-            for image in product_images:
-                file_path = os.path.join(settings.MEDIA_ROOT, 'product_images', image.name)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                with open(file_path, 'wb+') as destination:
-                    for chunk in image.chunks():
-                        destination.write(chunk)
-                ProductImage.create(product_id=instance.id, path=image.name)
-        return instance
\ No newline at end of file
+            images.create_product_images(instance.id, product_images)
+        # Product đổi category thì trang của cả category cũ lẫn mới đều đổi
+        versions.bump_products([instance.id], category_ids={old_category_id, instance.category_id})
+        changes = {field: getattr(instance, field) for field in validated_data}
+        if product_images is not None:
+            changes.update(events.image_changes(instance.id))
+        events.record({instance.id: changes})
+        return instance
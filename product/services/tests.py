@@ -1,3 +1,920 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock, skipUnless
+
+import jwt
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+from .models import Product, ProductImage, Category, Counter, ProductEvent, StockReservation
+from .serializers import CategorySerializer, ProductSerializer, ProductSerializerNotDetail
+from . import category_cache, events, fast_serializers, http_client, images, list_cache, repository, reservations, \
+    search, versions
+from .authentications import UserServiceAuthentication
+
+
+class CaptureReads(CaptureQueriesContext):
+    """
+    Đếm cả query qua ORM lẫn các lệnh gửi tới Mongo của repository (pymongo đi thẳng, không qua connection).
+    """
+
+    def __init__(self):
+        super().__init__(connection)
+        self.mongo_calls = []
+
+    def __enter__(self):
+        collection = repository._collection
+        calls = self.mongo_calls
+
+        class CountingCollection:
+            def __init__(self, model):
+                self._collection = collection(model)
+
+            def __getattr__(self, name):
+                calls.append(name)
+                return getattr(self._collection, name)
+
+        self._patch = mock.patch.object(repository, '_collection', CountingCollection)
+        self._patch.start()
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._patch.stop()
+        super().__exit__(exc_type, exc_value, traceback)
+
+    def __len__(self):
+        return super().__len__() + len(self.mongo_calls)
+
+
+@override_settings(CATEGORY_CACHE_CHECK_INTERVAL=60)
+class ProductListQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        for category_id in range(1, 4):
+            Category.objects.create(id=category_id, name=f'Category {category_id}')
+        for product_id in range(1, 51):
+            Product.objects.create(id=product_id, name=f'Product {product_id}', price=10.0, description='',
+                                   category_id=product_id % 3 + 1, stock=5)
+            ProductImage.objects.create(id=product_id * 2, path=f'{product_id}-a.jpg', product_id=product_id)
+            ProductImage.objects.create(id=product_id * 2 + 1, path=f'{product_id}-b.jpg', product_id=product_id)
+        category_cache.invalidate()
+        category_cache.get_categories()
+
+    def _count_queries(self, url):
+        with CaptureReads() as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        small_count, small = self._count_queries('/api/product?per_page=5')
+        large_count, large = self._count_queries('/api/product?per_page=50')
+        self.assertEqual(len(small['items']), 5)
+        self.assertEqual(len(large['items']), 50)
+        self.assertEqual(small_count, large_count)
+        # count + page + ảnh, category lấy từ cache
+        self.assertLessEqual(large_count, 3)
+
+    def test_list_joins_images_and_category(self):
+        _, data = self._count_queries('/api/product?per_page=1')
+        item = data['items'][0]
+        self.assertEqual([image['id'] for image in item['product_image']], [2, 3])
+        self.assertEqual(item['category']['id'], 2)
+
+    def test_batch_query_count_does_not_grow_with_ids(self):
+        small_count, _ = self._count_queries('/api/product/batch?ids=1,2')
+        large_count, data = self._count_queries('/api/product/batch?ids=' + ','.join(map(str, range(1, 51))))
+        self.assertEqual(len(data['items']), 50)
+        self.assertEqual(small_count, large_count)
+
+
+class BulkSoftDeleteTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for product_id in range(1, 101):
+            Product.objects.create(id=product_id, name=f'Product {product_id}', price=1.0, description='',
+                                   category_id=1, stock=1, is_active=product_id != 2)
+
+    def test_report_and_constant_query_count(self):
+        with CaptureReads() as queries:
+            response = self.client.delete('/api/product', [1, 2, 999], format='json')
+        self.assertEqual(response.data['success'], [1])
+        self.assertEqual(response.data['failure'], [
+            {'id': 2, 'error': 'Product already deleted'},
+            {'id': 999, 'error': 'Product not found'},
+        ])
+        small_count = len(queries)
+
+        with CaptureReads() as queries:
+            response = self.client.delete('/api/product', list(range(3, 101)), format='json')
+        self.assertEqual(len(response.data['success']), 98)
+        self.assertEqual(len(queries), small_count)
+        self.assertFalse(Product.objects.filter(is_active__in=[True]).exists())
+
+@override_settings(CATEGORY_CACHE_CHECK_INTERVAL=60)
+class CategoryCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        Category.create(name='Phone')
+        category_cache.invalidate()
+
+    def test_category_list_served_from_cache(self):
+        self.client.get('/api/product/category')
+        with CaptureReads() as queries:
+            response = self.client.get('/api/product/category')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([category['name'] for category in response.data], ['Phone'])
+
+    def test_write_refreshes_cache(self):
+        self.client.get('/api/product/category')
+        self.client.post('/api/product/category', {'category': 'Laptop'}, format='json')
+        response = self.client.get('/api/product/category')
+        self.assertEqual([category['name'] for category in response.data], ['Phone', 'Laptop'])
+
+    def test_stale_version_is_dropped(self):
+        category_cache.get_categories()
+        # Mô phỏng worker khác ghi category và tăng version
+        Category.create(name='Tablet')
+        Counter.get_next_sequence(category_cache.VERSION_KEY)
+        with override_settings(CATEGORY_CACHE_CHECK_INTERVAL=0):
+            self.assertIsNotNone(category_cache.get_category(2))
+
+
+class CounterTest(TestCase):
+    def test_concurrent_sequences_are_unique(self):
+        results = []
+
+        def take():
+            results.extend(Counter.get_next_sequence('test_concurrent') for _ in range(20))
+
+        threads = [threading.Thread(target=take) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), list(range(1, 101)))
+
+    def test_reserve_block_returns_contiguous_range(self):
+        self.assertEqual(list(Counter.reserve_block('test_block', 3)), [1, 2, 3])
+        self.assertEqual(list(Counter.reserve_block('test_block', 2)), [4, 5])
+
+    @override_settings(ID_BLOCK_SIZE=10)
+    def test_hilo_ids_come_from_reserved_block(self):
+        ids = [Counter.get_next_id('test_hilo') for _ in range(15)]
+        self.assertEqual(ids, list(range(1, 16)))
+        # 2 block đã được giữ, counter trong Mongo nằm ở cuối block thứ 2
+        self.assertEqual(Counter.get_current_sequence('test_hilo'), 20)
+
+
+class SearchTokenizeTest(SimpleTestCase):
+    def test_fold_removes_vietnamese_diacritics(self):
+        self.assertEqual(search.fold('Điện Thoại Sạc Nhanh'), 'dien thoai sac nhanh')
+
+    def test_tokenize_splits_and_dedupes(self):
+        self.assertEqual(search.tokenize('Ốp lưng - ốp LƯNG iPhone 15'), ['op', 'lung', 'iphone', '15'])
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for product_id, name in [(1, 'Điện thoại Samsung'), (2, 'Sạc điện thoại'), (3, 'Tai nghe'), (4, 'Điện thoại cũ')]:
+            product = Product.objects.create(id=product_id, name=name, price=1.0, description='', category_id=1, stock=1,
+                                             is_active=product_id != 4)
+            search.index_product(product)
+
+    def test_accent_insensitive_prefix_search(self):
+        self.assertEqual(search.search_product_ids('dien thoai'), [1, 2, 4])
+        self.assertEqual(search.search_product_ids('dien tho'), [1, 2, 4])
+        self.assertEqual(search.search_product_ids('sams'), [1])
+
+    def test_exact_matches_rank_first(self):
+        Product.objects.filter(id=3).update(name='Sạc dự phòng')
+        search.index_product(Product.objects.get(id=3))
+        self.assertEqual(search.search_product_ids('sac'), [2, 3])
+        self.assertEqual(search.search_product_ids('sa'), [1, 2, 3])
+
+    def test_list_view_hides_inactive_results(self):
+        response = self.client.get('/api/product?query=dien thoai')
+        self.assertEqual([item['id'] for item in response.data['items']], [1, 2])
+        self.assertFalse(response.data['truncated'])
+
+    @mock.patch('services.search.MAX_CANDIDATES', 2)
+    def test_candidates_are_capped_by_relevance(self):
+        for product_id, name in [(5, 'Taipei'), (6, 'Taiwan'), (10, 'Tai phone')]:
+            search.index_product(Product.objects.create(id=product_id, name=name, price=1.0, description='',
+                                                        category_id=1, stock=1))
+        # Khớp nguyên token được giữ dù id lớn hơn các kết quả khớp prefix
+        result = search.search('tai')
+        self.assertEqual((result.ids, result.truncated), ([3, 10], True))
+        # Token hiếm hơn ("phone") được tra trước nên không bị cắt
+        result = search.search('ta phone')
+        self.assertEqual((result.ids, result.truncated), ([10], False))
+        response = self.client.get('/api/product?query=tai')
+        self.assertTrue(response.data['truncated'])
+
+
+class ProductCursorPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        for product_id in range(1, 8):
+            Product.objects.create(id=product_id, name=f'Product {product_id}', price=1.0, description='',
+                                   category_id=1, stock=1, is_active=product_id != 3)
+
+    def test_walks_all_pages_without_count(self):
+        seen = []
+        url = '/api/product?per_page=2&after='
+        while True:
+            response = self.client.get(url)
+            self.assertNotIn('total_pages', response.data)
+            seen.extend(item['id'] for item in response.data['items'])
+            if not response.data['next']:
+                break
+            url = f"/api/product?per_page=2&after={response.data['next']}"
+        self.assertEqual(seen, [1, 2, 4, 5, 6, 7])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/product?after=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_cursor_survives_removed_product(self):
+        for product in Product.objects.all():
+            search.index_product(product)
+        response = self.client.get('/api/product?query=product&per_page=2&after=')
+        self.assertEqual([item['id'] for item in response.data['items']], [1, 2])
+        # Product cuối trang bị ẩn: trang sau vẫn tiếp tục, không quay về trang đầu
+        Product.objects.filter(id=2).update(is_active=False)
+        response = self.client.get(f"/api/product?query=product&per_page=2&after={response.data['next']}")
+        self.assertEqual([item['id'] for item in response.data['items']], [4, 5])
+        self.assertEqual(self.client.get('/api/product?query=product&after=not-a-cursor').status_code, 400)
+
+    def test_sorted_search_rejects_stale_cursor(self):
+        for product in Product.objects.all():
+            search.index_product(product)
+        response = self.client.get('/api/product?query=product&sort=newest&per_page=2&after=')
+        self.assertEqual([item['id'] for item in response.data['items']], [7, 6])
+        Product.objects.filter(id=6).update(is_active=False)
+        response = self.client.get(f"/api/product?query=product&sort=newest&per_page=2&after={response.data['next']}")
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_mode_still_reports_total_pages(self):
+        response = self.client.get('/api/product?per_page=2&page=2')
+        self.assertEqual(response.data['total_pages'], 3)
+        self.assertEqual([item['id'] for item in response.data['items']], [4, 5])
+
+
+@override_settings(CATEGORY_CACHE_CHECK_INTERVAL=60)
+class ProductFilterSortFacetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.phones = Category.create(name='Phones')
+        self.laptops = Category.create(name='Laptops')
+        category_cache.invalidate()
+        for product_id, price, stock, category in [(1, 300000, 0, self.phones), (2, 80000, 5, self.phones),
+                                                   (3, 2000000, 1, self.laptops), (4, 700000, 2, self.phones)]:
+            product = Product.objects.create(id=product_id, name=f'Product {product_id}', price=price,
+                                             description='', category_id=category.id, stock=stock)
+            search.index_product(product)
+
+    def test_price_range_and_in_stock_filters(self):
+        response = self.client.get('/api/product?min_price=100000&max_price=1000000&in_stock=1')
+        self.assertEqual([item['id'] for item in response.data['items']], [4])
+
+    def test_sort_by_price_and_newest(self):
+        response = self.client.get('/api/product?sort=-price')
+        self.assertEqual([item['id'] for item in response.data['items']], [3, 4, 1, 2])
+        response = self.client.get('/api/product?sort=newest&per_page=2&after=')
+        self.assertEqual([item['id'] for item in response.data['items']], [4, 3])
+
+    def test_invalid_sort_or_filter(self):
+        self.assertEqual(self.client.get('/api/product?sort=name').status_code, 400)
+        self.assertEqual(self.client.get('/api/product?min_price=abc').status_code, 400)
+
+    def test_facets_ignore_their_own_filter(self):
+        response = self.client.get(f'/api/product?facets=1&category_id={self.phones.id}')
+        result = response.data['facets']
+        self.assertEqual(result['total'], 3)
+        self.assertEqual({group['name']: group['count'] for group in result['categories']},
+                         {'Phones': 3, 'Laptops': 1})
+        self.assertEqual(result['in_stock'], 2)
+        self.assertEqual([(bucket['min'], bucket['count']) for bucket in result['price_ranges']],
+                         [(0, 1), (100000, 1), (500000, 1)])
+
+    def test_facets_ignore_their_own_filter_with_query(self):
+        response = self.client.get(f'/api/product?facets=1&query=product&category_id={self.phones.id}')
+        self.assertEqual({group['name']: group['count'] for group in response.data['facets']['categories']},
+                         {'Phones': 3, 'Laptops': 1})
+        response = self.client.get('/api/product?facets=1&query=product&min_price=100000')
+        self.assertEqual([(bucket['min'], bucket['count']) for bucket in response.data['facets']['price_ranges']],
+                         [(0, 1), (100000, 1), (500000, 1), (1000000, 1)])
+
+    @override_settings(PRODUCT_PRICE_FACET_BOUNDARIES=[100000, 500000, 1000000])
+    def test_price_facet_reports_prices_below_and_above_boundaries(self):
+        result = self.client.get('/api/product?facets=1').data['facets']
+        self.assertEqual([(bucket['min'], bucket['max'], bucket['count']) for bucket in result['price_ranges']],
+                         [(None, 100000, 1), (100000, 500000, 1), (500000, 1000000, 1), (1000000, None, 1)])
+
+
+class MongoIndexCommandTest(TestCase):
+    def test_creates_declared_indexes_once(self):
+        out = StringIO()
+        call_command('mongo_indexes', stdout=out)
+        self.assertIn('products.products_id: creating', out.getvalue())
+        names = {index['name'] for index in ProductImage.objects.mongo_list_indexes()}
+        self.assertIn('product_images_product_id', names)
+
+        out = StringIO()
+        call_command('mongo_indexes', stdout=out)
+        self.assertNotIn('creating', out.getvalue())
+        self.assertIn('products.products_active_category_id: ok', out.getvalue())
+
+
+@skipUnless(mongomock, 'cần mongomock')
+class RepositoryTest(SimpleTestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        patcher = mock.patch.object(repository, 'get_database', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db.products.insert_many([
+            {'id': product_id, 'name': f'Product {product_id}', 'price': float(product_id), 'description': '',
+             'category_id': 1, 'stock': 1, 'is_active': product_id != 3, 'version': product_id}
+            for product_id in range(1, 8)
+        ])
+        self.db.product_images.insert_many([
+            {'id': 2, 'path': 'b.jpg', 'product_id': 1, 'status': 'READY', 'thumbnail_path': 't.webp', 'large_path': ''},
+            {'id': 1, 'path': 'a.jpg', 'product_id': 1, 'status': 'PENDING', 'thumbnail_path': '', 'large_path': ''},
+        ])
+
+    def test_get_product_builds_model_instance(self):
+        product = repository.get_product(2)
+        self.assertIsInstance(product, Product)
+        self.assertEqual((product.name, product.price, product.version), ('Product 2', 2.0, 2))
+        self.assertFalse(product._state.adding)
+        self.assertIsNone(repository.get_product(99))
+        self.assertEqual(repository.get_product_version(5), 5)
+
+    def test_query_sorts_counts_and_seeks(self):
+        query = repository.ProductQuery({'is_active': True}, ('-price', '-id'))
+        self.assertEqual(query.count(), 6)
+        self.assertEqual([product.id for product in query[1:3]], [6, 5])
+        newest = repository.ProductQuery({'is_active': True}, ('-id',))
+        self.assertEqual([product.id for product in newest.seek(5)[:2]], [4, 2])
+        self.assertEqual(query.ids([1, 3, 4]), [4, 1])
+
+    def test_images_grouped_by_product(self):
+        images_by_product = repository.images_for_products([1, 2])
+        self.assertEqual([image.path for image in images_by_product[1]], ['a.jpg', 'b.jpg'])
+        self.assertEqual(images_by_product[2], [])
+
+
+@override_settings(SERVICE_AUTH_TOKEN='cart-service-secret')
+class ProductEventFeedTest(TestCase):
+    def setUp(self):
+        self.client = APIClient(HTTP_SERVICE_TOKEN='cart-service-secret')
+        Product.objects.create(id=1, name='Phone', price=1.0, description='', category_id=1, stock=1)
+        Product.objects.create(id=2, name='Case', price=1.0, description='', category_id=1, stock=1)
+
+    def _feed(self, after=0):
+        response = self.client.get(f'/api/product/events?after={after}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_writes_append_events_in_order(self):
+        start = Counter.get_current_sequence(events.OFFSET_KEY)
+        reservations.change_stock(1, 5)
+        self.client.delete('/api/product', [2], format='json')
+        self.client.patch('/api/product/1', {'price': 2.5}, format='json')
+
+        data = self._feed(start)
+        self.assertEqual([(event['product_id'], event['changes']) for event in data['events']],
+                         [(1, {'stock': 6}), (2, {'is_active': False}), (1, {'price': 2.5})])
+        self.assertEqual(data['events'][0]['version'], 1)
+        self.assertEqual(data['next'], data['events'][-1]['offset'])
+        self.assertEqual(self._feed(data['next'])['events'], [])
+
+    def test_update_accepts_matching_id(self):
+        start = Counter.get_current_sequence(events.OFFSET_KEY)
+        response = self.client.patch('/api/product/1', {'id': 1, 'price': 3.0}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Product.objects.get(id=1).price, 3.0)
+        [event] = self._feed(start)['events']
+        self.assertEqual(event['changes'], {'price': 3.0})
+        self.assertEqual(self.client.patch('/api/product/1', {'id': 2, 'price': 4.0}, format='json').status_code, 400)
+        self.assertEqual(Product.objects.get(id=1).price, 3.0)
+
+    def test_image_only_update_records_event(self):
+        start = Counter.get_current_sequence(events.OFFSET_KEY)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.patch('/api/product/1', {'product_images': [SimpleUploadedFile('a.jpg', b'photo')]},
+                                         format='multipart')
+        self.assertEqual(response.status_code, 202)
+        [event] = self._feed(start)['events']
+        self.assertEqual(event['product_id'], 1)
+        self.assertEqual(event['changes'], {'images': [ProductImage.objects.get(product_id=1).path]})
+
+    def test_stops_before_recent_gap(self):
+        start = Counter.get_current_sequence(events.OFFSET_KEY)
+        ProductEvent.objects.mongo_insert_one({'offset': start + 2, 'product_id': 1, 'changes': {'stock': 0},
+                                               'version': 1, 'created_at': timezone.now()})
+        self.assertEqual(self._feed(start)['events'], [])
+        with override_settings(PRODUCT_EVENT_GAP_GRACE=-1):
+            self.assertEqual([event['offset'] for event in self._feed(start)['events']], [start + 2])
+
+    def test_requires_service_token(self):
+        self.assertEqual(APIClient().get('/api/product/events').status_code, 403)
+        self.assertEqual(APIClient(HTTP_CROSS_SERVICE='Cart Service').get('/api/product/events').status_code, 403)
+
+
+@override_settings(CATEGORY_CACHE_CHECK_INTERVAL=60)
+class ProductExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user={'id': 1, 'role': {'name': 'ADMIN'}})
+        category = Category.create(name='Phone')
+        category_cache.invalidate()
+        for product_id in range(1, 6):
+            Product.objects.create(id=product_id, name=f'Product {product_id}', price=1.0, description='',
+                                   category_id=category.id, stock=1, is_active=product_id != 4)
+            ProductImage.objects.create(id=product_id, path=f'{product_id}.jpg', product_id=product_id)
+
+    def _export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        return response, [json.loads(line) for line in lines]
+
+    @mock.patch('services.views.ProductExportView.BATCH_SIZE', 2)
+    def test_streams_active_products_with_images_and_category(self):
+        _, items = self._export('/api/product/export')
+        self.assertEqual([item['id'] for item in items], [1, 2, 3, 5])
+        self.assertEqual(items[0]['category']['name'], 'Phone')
+        self.assertTrue(items[0]['product_image'][0]['path'].endswith('/product_images/1.jpg'))
+
+    @mock.patch('services.views.ProductExportView.BATCH_SIZE', 1)
+    def test_incremental_export_uses_event_offset(self):
+        response, _ = self._export('/api/product/export')
+        offset = int(response['X-Events-Offset'])
+        reservations.change_stock(2, 3)
+        self.client.delete('/api/product', [3], format='json')
+
+        response, items = self._export(f'/api/product/export?updated_since={offset}')
+        self.assertEqual([(item['id'], item['stock'], item['is_active']) for item in items],
+                         [(2, 4, True), (3, 1, False)])
+        self.assertGreater(int(response['X-Events-Offset']), offset)
+
+    def test_admin_only(self):
+        self.assertEqual(APIClient().get('/api/product/export').status_code, 403)
+
+
+@override_settings(CATEGORY_CACHE_CHECK_INTERVAL=60)
+class SparseFieldsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        category = Category.create(name='Phone')
+        category_cache.invalidate()
+        for product_id in range(1, 4):
+            Product.objects.create(id=product_id, name=f'Product {product_id}', price=2.0, description='',
+                                   category_id=category.id, stock=3)
+            ProductImage.objects.create(id=product_id, path=f'{product_id}.jpg', product_id=product_id)
+
+    def test_list_trims_output_and_skips_image_lookup(self):
+        self.client.get('/api/product')
+        with CaptureReads() as full:
+            self.client.get('/api/product?page=2')
+        with CaptureReads() as sparse:
+            response = self.client.get('/api/product?fields=id,price,stock,is_active')
+        self.assertEqual(response.data['items'][0], {'id': 1, 'price': 2.0, 'stock': 3, 'is_active': True})
+        # Chỉ 1 lệnh find cho trang product, không có find ảnh
+        self.assertEqual(sparse.mongo_calls.count('find'), 1)
+        self.assertEqual(full.mongo_calls.count('find'), 2)
+
+    def test_detail_and_batch_accept_fields(self):
+        response = self.client.get('/api/product/1?fields=id,price')
+        self.assertEqual(response.data, {'id': 1, 'price': 2.0})
+        response = self.client.get('/api/product/batch?ids=1,2&fields=id,stock&details=1')
+        self.assertEqual(response.data['items'], [{'id': 1, 'stock': 3}, {'id': 2, 'stock': 3}])
+
+    def test_batch_can_include_inactive_products(self):
+        Product.objects.filter(id=2).update(is_active=False)
+        response = self.client.get('/api/product/batch?ids=1,2&fields=id,is_active')
+        self.assertEqual((response.data['items'], response.data['inactive']), ([{'id': 1, 'is_active': True}], [2]))
+        response = self.client.get('/api/product/batch?ids=1,2&fields=id,is_active&include_inactive=1')
+        self.assertEqual(response.data['items'], [{'id': 1, 'is_active': True}, {'id': 2, 'is_active': False}])
+        self.assertEqual(response.data['inactive'], [2])
+
+    def test_projection_defers_unrequested_fields(self):
+        product = repository.get_product(1, fields={'id', 'price'})
+        self.assertEqual(product.price, 2.0)
+        self.assertIn('name', product.get_deferred_fields())
+
+    def test_unknown_field_is_rejected(self):
+        self.assertEqual(self.client.get('/api/product?fields=id,secret').status_code, 400)
+        self.assertEqual(self.client.get('/api/product/1?fields=product_image').status_code, 400)
+
+
+class FastSerializerParityTest(SimpleTestCase):
+    """Output của fast_serializers phải giống từng byte với DRF serializer."""
+
+    def setUp(self):
+        self.request = APIRequestFactory().get('/api/product')
+        phone = Category(id=1, name='Điện thoại', is_active=True)
+        hidden = Category(id=2, name='Cũ', is_active=False)
+        self.categories_by_id = {1: phone, 2: hidden}
+        self.products = [
+            Product(id=1, name='Phone', price=10, description='Mô tả', category_id=1, stock=3, is_active=True, version=2),
+            Product(id=2, name='Case', price=1.5, description=None, category_id=2, stock=0, is_active=False),
+            Product(id=3, name='Orphan', price=0.0, description='', category_id=99, stock=1, is_active=True),
+        ]
+        self.images_by_product = {
+            1: [ProductImage(id=7, path='aa/x.jpg', product_id=1, status=ProductImage.READY,
+                             thumbnail_path='variants/t.webp', large_path='variants/l.webp'),
+                ProductImage(id=8, path='bb/y.png', product_id=1)],
+            2: [],
+            3: [],
+        }
+
+    def _assert_same(self, serializer_class, fields=None, variant='thumbnail'):
+        context = {
+            'request': self.request, 'fields': fields, 'image_variant': variant,
+            'images_by_product': self.images_by_product, 'categories_by_id': self.categories_by_id,
+        }
+        expected = serializer_class(self.products, many=True, context=context).data
+        actual = fast_serializers.serialize_products(
+            self.products, serializer_class, self.request, fields, variant,
+            images_by_product=self.images_by_product, categories_by_id=self.categories_by_id,
+        )
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_full_representation(self):
+        for serializer_class in (ProductSerializer, ProductSerializerNotDetail):
+            for variant in ('thumbnail', 'large'):
+                with self.subTest(serializer=serializer_class.__name__, variant=variant):
+                    self._assert_same(serializer_class, variant=variant)
+
+    def test_sparse_fields(self):
+        self._assert_same(ProductSerializer, {'id', 'price', 'stock', 'is_active'})
+        self._assert_same(ProductSerializer, {'category', 'product_image'})
+        self._assert_same(ProductSerializerNotDetail, {'img_url', 'description'})
+
+    def test_categories(self):
+        categories = list(self.categories_by_id.values())
+        self.assertEqual(JSONRenderer().render(fast_serializers.serialize_categories(categories)),
+                         JSONRenderer().render(CategorySerializer(categories, many=True).data))
+
+
+@override_settings(SERVICE_AUTH_TOKEN='order-service-secret')
+class StockReservationTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient(HTTP_SERVICE_TOKEN='order-service-secret')
+        Product.objects.create(id=1, name='Hot item', price=1.0, description='', category_id=1, stock=50)
+
+    def test_concurrent_reservations_never_oversell(self):
+        results = []
+
+        def take():
+            results.append(reservations.reserve(1, 1))
+
+        threads = [threading.Thread(target=take) for _ in range(200)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(1 for reservation in results if reservation is not None), 50)
+        self.assertEqual(Product.objects.get(id=1).stock, 0)
+        self.assertEqual(StockReservation.objects.count(), 50)
+
+    def test_commit_and_release(self):
+        response = self.client.post('/api/product/1/reservations', {'quantity': 5}, format='json')
+        self.assertEqual(response.status_code, 201)
+        reservation_id = response.data['id']
+        self.assertEqual(Product.objects.get(id=1).stock, 45)
+
+        self.assertEqual(self.client.post(f'/api/product/reservations/{reservation_id}/commit').status_code, 202)
+        # Reservation đã commit thì không release được nữa
+        self.assertEqual(self.client.post(f'/api/product/reservations/{reservation_id}/release').status_code, 409)
+        self.assertEqual(Product.objects.get(id=1).stock, 45)
+
+        reservation = reservations.reserve(1, 10)
+        self.assertTrue(reservations.release(reservation.id))
+        self.assertEqual(Product.objects.get(id=1).stock, 45)
+
+    def test_requires_service_token(self):
+        reservation = reservations.reserve(1, 5)
+        for client in (APIClient(HTTP_CROSS_SERVICE='Order Service'), APIClient(HTTP_SERVICE_TOKEN='guess')):
+            self.assertEqual(client.post('/api/product/1/reservations', {'quantity': 5}, format='json').status_code,
+                             403)
+            self.assertEqual(client.post(f'/api/product/reservations/{reservation.id}/release').status_code, 403)
+            self.assertEqual(client.post(f'/api/product/reservations/{reservation.id}/commit').status_code, 403)
+        self.assertEqual(Product.objects.get(id=1).stock, 45)
+        with self.settings(SERVICE_AUTH_TOKEN=''):
+            response = APIClient(HTTP_SERVICE_TOKEN='').post('/api/product/1/reservations', {'quantity': 5},
+                                                             format='json')
+            self.assertEqual(response.status_code, 403)
+
+    def test_insufficient_stock(self):
+        response = self.client.post('/api/product/1/reservations', {'quantity': 51}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Product.objects.get(id=1).stock, 50)
+
+    def test_ttl_is_validated(self):
+        for ttl in (0, -5, 10 ** 9):
+            response = self.client.post('/api/product/1/reservations', {'quantity': 1, 'ttl': ttl}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.get(id=1).stock, 50)
+        response = self.client.post('/api/product/1/reservations', {'quantity': 1, 'ttl': 60}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_expired_reservations_are_swept(self):
+        reservation = reservations.reserve(1, 20, ttl=-1)
+        self.assertFalse(reservations.commit(reservation.id))
+        self.assertEqual(reservations.release_expired(), 1)
+        self.assertEqual(StockReservation.objects.get(id=reservation.id).status, StockReservation.EXPIRED)
+        self.assertEqual(Product.objects.get(id=1).stock, 50)
+
+
+class ImageVariantTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        Product.objects.create(id=1, name='Camera', price=1.0, description='', category_id=1, stock=1)
+        ProductImage.objects.create(id=1, path='a.jpg', product_id=1, status=ProductImage.READY,
+                                    thumbnail_path='variants/a-thumbnail.webp', large_path='variants/a-large.webp')
+        ProductImage.objects.create(id=2, path='b.jpg', product_id=1)
+
+    def test_list_uses_thumbnails_and_detail_uses_large(self):
+        item = self.client.get('/api/product').data['items'][0]
+        self.assertTrue(item['product_image'][0]['path'].endswith('/media/product_images/variants/a-thumbnail.webp'))
+        # Ảnh chưa xử lý xong thì trả về file gốc
+        self.assertTrue(item['product_image'][1]['path'].endswith('/media/product_images/b.jpg'))
+
+        detail = self.client.get('/api/product/1?details=1').data
+        self.assertTrue(detail['product_image'][0]['path'].endswith('/media/product_images/variants/a-large.webp'))
+
+    @mock.patch('services.images.make_variants', return_value=('variants/b-thumbnail.webp', 'variants/b-large.webp'))
+    def test_stale_processing_image_is_reclaimed(self, make_variants):
+        now = timezone.now()
+        ProductImage.objects.filter(id=2).update(status=ProductImage.PROCESSING,
+                                                  claimed_at=now - timezone.timedelta(hours=1))
+        ProductImage.objects.create(id=3, path='c.jpg', product_id=1, status=ProductImage.PROCESSING, claimed_at=now)
+
+        self.assertEqual(images.process_pending(), 1)
+        # Ảnh 2 của worker đã chết được xử lý lại, ảnh 3 đang có worker khác giữ thì không đụng tới
+        self.assertEqual(ProductImage.objects.get(id=2).status, ProductImage.READY)
+        self.assertEqual(ProductImage.objects.get(id=3).status, ProductImage.PROCESSING)
+
+
+class ContentAddressedImageTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def _upload(self, product_id, content):
+        images.create_product_images(product_id, [SimpleUploadedFile('photo.JPG', content)])
+
+    def test_same_content_is_stored_once(self):
+        for product_id in range(1, 4):
+            self._upload(product_id, b'same vendor photo')
+        paths = set(ProductImage.objects.values_list('path', flat=True))
+        self.assertEqual(len(paths), 1)
+        path = paths.pop()
+        self.assertTrue(path.endswith('.jpg'))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'product_images', path)))
+
+    def test_orphans_are_collected(self):
+        self._upload(1, b'old photo')
+        self._upload(2, b'old photo')
+        self._upload(1, b'new photo')
+        ProductImage.objects.filter(product_id=1, path=ProductImage.objects.filter(product_id=2).get().path).delete()
+        # Ảnh vẫn còn product 2 tham chiếu nên chưa bị xoá
+        self.assertEqual(images.collect_garbage(grace_seconds=0), [])
+
+        ProductImage.objects.filter(product_id=2).delete()
+        removed = images.collect_garbage(grace_seconds=0)
+        self.assertEqual(len(removed), 1)
+        remaining = ProductImage.objects.get(product_id=1).path
+        self.assertNotEqual(removed[0], remaining)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'product_images', remaining)))
+
+
+@override_settings(CATEGORY_CACHE_CHECK_INTERVAL=60, PRODUCT_VERSION_CHECK_INTERVAL=60)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        Category.create(name='Phone')
+        category_cache.invalidate()
+        Product.objects.create(id=1, name='Phone X', price=1.0, description='', category_id=1, stock=1)
+        versions.bump_products()
+
+    def _revalidate(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with CaptureReads() as queries:
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        return etag, len(queries)
+
+    def test_list_and_categories_revalidate_without_queries(self):
+        list_etag, list_queries = self._revalidate('/api/product')
+        category_etag, category_queries = self._revalidate('/api/product/category')
+        self.assertEqual(list_queries, 0)
+        self.assertEqual(category_queries, 0)
+
+        versions.bump_products([1])
+        self.assertEqual(self.client.get('/api/product', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.client.post('/api/product/category', {'category': 'Laptop'}, format='json')
+        self.assertEqual(self.client.get('/api/product/category', HTTP_IF_NONE_MATCH=category_etag).status_code, 200)
+
+    def test_detail_revalidates_on_product_version(self):
+        etag, _ = self._revalidate('/api/product/1')
+        reservations.change_stock(1, 5)
+        response = self.client.get('/api/product/1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 6)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(CATEGORY_CACHE_CHECK_INTERVAL=60, PRODUCT_VERSION_CHECK_INTERVAL=0)
+class ProductListCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        for product_id in range(1, 5):
+            Product.objects.create(id=product_id, name=f'Product {product_id}', price=1.0, description='',
+                                   category_id=1 if product_id <= 2 else 2, stock=1)
+
+    def _queries(self, url):
+        with CaptureReads() as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_hit_served_without_queries(self):
+        self._queries('/api/product?category_id=1')
+        count, data = self._queries('/api/product?category_id=1&page=1&per_page=10')
+        self.assertEqual(count, 0)
+        self.assertEqual([item['id'] for item in data['items']], [1, 2])
+
+    def test_write_invalidates_cached_pages(self):
+        for url in ('/api/product?category_id=1', '/api/product?category_id=2', '/api/product'):
+            self._queries(url)
+
+        response = self.client.patch('/api/product/3', {'price': 9.0}, format='json')
+        self.assertEqual(response.status_code, 202)
+
+        count, data = self._queries('/api/product?category_id=2')
+        self.assertGreater(count, 0)
+        self.assertEqual(data['items'][0]['price'], 9.0)
+        self.assertGreater(self._queries('/api/product')[0], 0)
+        # Trang của category khác vẫn lấy từ cache
+        self.assertEqual(self._queries('/api/product?category_id=1')[0], 0)
+
+    def test_reservation_keeps_other_categories_cached(self):
+        self._queries('/api/product?category_id=1')
+        etag = self.client.get('/api/product?category_id=1')['ETag']
+        reservations.reserve(3, 1)
+        self.assertEqual(self._queries('/api/product?category_id=1')[0], 0)
+        self.assertEqual(self.client.get('/api/product?category_id=1', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self._queries('/api/product?category_id=2')[1]['items'][0]['stock'], 0)
+
+    def test_bump_from_another_process_invalidates(self):
+        self._queries('/api/product?category_id=2')
+        # Process khác (vd. process_images) ghi vào Mongo và tăng version, không đụng tới cache của worker này
+        Product.objects.filter(id=3).update(price=9.0)
+        Counter.get_next_sequence(versions.version_key(2))
+
+        count, data = self._queries('/api/product?category_id=2')
+        self.assertGreater(count, 0)
+        self.assertEqual(data['items'][0]['price'], 9.0)
+
+    def test_concurrent_misses_build_once(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.05)
+            return Response({'items': []})
+
+        threads = [threading.Thread(target=list_cache.get_or_build, args=('stampede-test', build)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+
+    @override_settings(PRODUCT_LIST_CACHE_LOCK_TIMEOUT=1)
+    def test_waiter_does_not_release_lock_it_does_not_hold(self):
+        cache.add('timeout-test:lock', 1, timeout=60)
+        list_cache.get_or_build('timeout-test', lambda: Response({'items': []}, status=500))
+        self.assertIsNotNone(cache.get('timeout-test:lock'))
+
+
+@override_settings(USER_SERVICE_URL='http://127.0.0.1:1/api/user', JWT_VERIFYING_KEY=None, HTTP_CLIENT_RETRIES=1,
+                   HTTP_CLIENT_BACKOFF=0, HTTP_CLIENT_FAILURE_THRESHOLD=2, HTTP_CLIENT_RESET_TIMEOUT=60)
+class UserServiceCircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        http_client.reset()
+        self.addCleanup(http_client.reset)
+        self.request = APIRequestFactory().get('/api/product', HTTP_AUTHORIZATION='Bearer token')
+
+    def test_user_service_down_opens_breaker(self):
+        authentication = UserServiceAuthentication()
+        # Port 1 không có server: 2 lần kết nối lỗi (1 lần + 1 retry) làm breaker mở
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate(self.request)
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate(self.request)
+
+        stats = http_client.metrics()['endpoints']['user']
+        self.assertEqual((stats['requests'], stats['short_circuited'], stats['breaker']), (2, 1, 'open'))
+
+    @override_settings(SERVICE_AUTH_TOKEN='metrics-secret')
+    def test_metrics_require_service_token(self):
+        url = '/api/product/http-metrics'
+        self.assertEqual(APIClient(HTTP_CROSS_SERVICE='Cart Service').get(url).status_code, 403)
+        self.assertEqual(APIClient(HTTP_SERVICE_TOKEN='metrics-secret').get(url).status_code, 200)
+
+
+@override_settings(JWT_VERIFYING_KEY='shared-key', JWT_ALGORITHM='HS256', JWT_CACHE_TTL=0)
+class LocalTokenVerificationTest(TestCase):
+    @mock.patch('services.authentications.http_client.get')
+    def test_admin_token_is_verified_without_user_service(self, get):
+        token = jwt.encode({'token_type': 'access', 'user_id': 1, 'id': 1, 'role': {'id': 1, 'name': 'ADMIN'},
+                            'exp': int(time.time()) + 300}, 'shared-key', algorithm='HS256')
+        response = APIClient().get('/api/product/export', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        get.assert_not_called()
+
+        forged = jwt.encode({'token_type': 'access', 'id': 1, 'role': {'id': 1, 'name': 'ADMIN'},
+                             'exp': int(time.time()) + 300}, 'other-key', algorithm='HS256')
+        response = APIClient().get('/api/product/export', HTTP_AUTHORIZATION=f'Bearer {forged}')
+        self.assertIn(response.status_code, (401, 403))
+
+
+class ImportCatalogTest(TestCase):
+    def test_duplicate_ids_and_blank_categories(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'catalog.ndjson')
+        with open(path, 'w') as f:
+            for row in [{'id': 501, 'name': 'Old name', 'price': 1, 'category': 'Phones'},
+                        {'id': 501, 'name': 'New name', 'price': 2, 'category': 'Phones'},
+                        {'id': 502, 'name': 'No category', 'price': 3, 'category': ' '}]:
+                f.write(json.dumps(row) + '\n')
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err)
+
+        self.assertEqual(list(Product.objects.filter(id__in=[501, 502]).values_list('id', 'name')), [(501, 'Old name')])
+        self.assertFalse(Category.objects.filter(name__in=['', ' ']).exists())
+        self.assertIn('duplicate ids 1, row errors 1', out.getvalue())
+        self.assertIn('No category', err.getvalue())
+
+    def test_generated_ids_skip_explicit_and_existing_ids(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        start = Counter.get_current_sequence('product')
+        Product.objects.create(id=start + 1, name='Existing', price=1.0, description='', category_id=1, stock=1)
+        path = os.path.join(directory, 'catalog.ndjson')
+        with open(path, 'w') as f:
+            for row in [{'name': 'Generated 1', 'category_id': 1}, {'id': start + 2, 'name': 'Explicit', 'category_id': 1},
+                        {'name': 'Generated 2', 'category_id': 1}, {'id': start + 4, 'name': 'Explicit 2', 'category_id': 1}]:
+                f.write(json.dumps(row) + '\n')
+        call_command('import_catalog', path, stdout=StringIO(), stderr=StringIO())
+
+        names = dict(Product.objects.filter(id__gt=start).values_list('name', 'id'))
+        self.assertEqual(len(names), 5)
+        self.assertEqual((names['Explicit'], names['Explicit 2']), (start + 2, start + 4))
+        self.assertTrue({names['Generated 1'], names['Generated 2']}.isdisjoint({start + 1, start + 2, start + 4}))
+        product = Product.create(name='Via API', price=1.0, description='', category_id=1, stock=1)
+        self.assertGreater(product.id, max(names.values()))
 
-# Create your tests here.
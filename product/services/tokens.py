@@ -0,0 +1,76 @@
+"""
+Xác thực access token ngay trong service bằng khoá dùng chung với User Service (JWT_VERIFYING_KEY),
+không phải gọi /get-user-info cho mỗi request. Token đã xác thực được giữ trong bộ nhớ JWT_CACHE_TTL giây,
+key là hash của token.
+"""
+import hashlib
+import threading
+import time
+
+import jwt
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+
+# Giới hạn số token giữ trong cache của mỗi process
+CACHE_MAX_SIZE = 10000
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(key, now):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        user_data, expires_at = entry
+        if expires_at <= now:
+            del _cache[key]
+            return None
+        return user_data
+
+
+def _remember(key, user_data, expires_at):
+    with _cache_lock:
+        if len(_cache) >= CACHE_MAX_SIZE:
+            now = time.time()
+            for stale in [k for k, (_, expires) in _cache.items() if expires <= now]:
+                del _cache[stale]
+            if len(_cache) >= CACHE_MAX_SIZE:
+                _cache.clear()
+        _cache[key] = (user_data, expires_at)
+
+
+def verify(token):
+    """
+    Trả về user_data ({'id', 'username', 'role'}) giống /get-user-info nếu token hợp lệ.
+    Trả về None nếu token hợp lệ nhưng chưa có claim id / role (token phát hành trước đây),
+    khi đó caller hỏi lại User Service. Token sai chữ ký / hết hạn thì ném AuthenticationFailed.
+    """
+    now = time.time()
+    key = hashlib.sha256(token.encode()).hexdigest()
+    if settings.JWT_CACHE_TTL:
+        user_data = _cached(key, now)
+        if user_data is not None:
+            return user_data
+
+    try:
+        claims = jwt.decode(token, settings.JWT_VERIFYING_KEY, algorithms=[settings.JWT_ALGORITHM],
+                            options={'require': ['exp']})
+    except jwt.InvalidTokenError as e:
+        raise AuthenticationFailed(f"Token không hợp lệ: {str(e)}")
+    if claims.get('token_type', 'access') != 'access':
+        raise AuthenticationFailed("Token không phải access token")
+    if 'id' not in claims or 'role' not in claims:
+        return None
+
+    user_data = {'id': claims['id'], 'username': claims.get('username'), 'role': claims['role']}
+    if settings.JWT_CACHE_TTL:
+        # Không giữ lâu hơn thời hạn của token
+        _remember(key, user_data, min(now + settings.JWT_CACHE_TTL, claims['exp']))
+    return user_data
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
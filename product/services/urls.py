@@ -3,8 +3,17 @@ from . import views
 
 urlpatterns = [
     path('product/<int:id>', views.ProductDetailView.as_view(), name='product-detail'),
+    path('product/batch', views.ProductBatchView.as_view(), name='product-batch'),
     path('product', views.ProductListView.as_view(), name='product-list'),
+    path('product/events', views.ProductEventFeedView.as_view(), name='product-events'),
+    path('product/export', views.ProductExportView.as_view(), name='product-export'),
+    path('product/http-metrics', views.HttpClientMetricsView.as_view(), name='product-http-metrics'),
     path('product/category', views.CategoryListView.as_view(), name='category-list'),
     path('product/category/<int:id>', views.CategoryDetailView.as_view(), name='category-detail'),
     path('product/<int:id>/stock', views.ProductStockView.as_view(), name='product-stock'),
+    path('product/<int:id>/reservations', views.StockReservationView.as_view(), name='stock-reservation'),
+    path('product/reservations/<int:reservation_id>/commit', views.StockReservationCommitView.as_view(),
+         name='stock-reservation-commit'),
+    path('product/reservations/<int:reservation_id>/release', views.StockReservationReleaseView.as_view(),
+         name='stock-reservation-release'),
 ]
\ No newline at end of file
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Counter, Product
+
+# Version của từng category (product_version:<category_id>) và của cả collection (product_version:all),
+# tăng sau mỗi lần ghi product thuộc category đó / bất kỳ product nào
+PRODUCTS_VERSION_KEY = 'product_version'
+ALL_CATEGORIES = 'all'
+
+_lock = threading.Lock()
+# key counter -> (version, thời điểm đọc)
+_state = {}
+
+
+def version_key(category_id=None):
+    return f'{PRODUCTS_VERSION_KEY}:{ALL_CATEGORIES if category_id is None else int(category_id)}'
+
+
+def products_version(category_id=None):
+    """
+    Đọc version của products thuộc `category_id` (None = mọi category), mỗi worker chỉ hỏi lại counters
+    tối đa mỗi PRODUCT_VERSION_CHECK_INTERVAL giây cho mỗi key.
+    """
+    key = version_key(category_id)
+    now = time.monotonic()
+    with _lock:
+        cached = _state.get(key)
+        if cached is None or now - cached[1] >= settings.PRODUCT_VERSION_CHECK_INTERVAL:
+            cached = _state[key] = (Counter.get_current_sequence(key), now)
+        return cached[0]
+
+
+def bump_products(product_ids=(), category_ids=None):
+    """
+    Gọi sau mỗi lần ghi product: tăng version của từng product (nếu có), version của các category
+    chứa các product đó và version của cả collection. Các version này nằm trong key cache / ETag của
+    trang danh sách nên tăng chúng là bỏ cache ở mọi process, nhưng chỉ các trang của category bị ảnh hưởng.
+    `category_ids` None thì tra category từ `product_ids`.
+    """
+    product_ids = list(product_ids)
+    if product_ids:
+        Product.objects.mongo_update_many({'id': {'$in': product_ids}}, {'$inc': {'version': 1}})
+        if category_ids is None:
+            category_ids = Product.objects.mongo_distinct('category_id', {'id': {'$in': product_ids}})
+    keys = {version_key(category_id) for category_id in category_ids or () if category_id is not None}
+    keys.add(version_key())
+    for key in sorted(keys):
+        Counter.get_next_sequence(key)
+    with _lock:
+        for key in keys:
+            _state.pop(key, None)
@@ -1,29 +1,90 @@
+import itertools
+import json
 from http.client import responses
 
 from django.contrib.messages import success
 from django.db.transaction import atomic
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.paginator import Paginator
-from .models import Product, ProductImage, Category
+from .pagination import encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor
+from .models import Counter, Product, ProductImage, Category
 from .serializers import ProductSerializer, ProductCreateUpdateSerializer, CategorySerializer, \
-    ProductSerializerNotDetail
-from .permissions import IsAdminRole
+    ProductSerializerNotDetail, StockReservationSerializer, parse_fields, model_fields_for
+from .permissions import IsAdminRole, IsAuthenticatedService
+from . import category_cache, events, facets, fast_serializers, http_client, list_cache, repository, reservations, \
+    search, versions
+
+
+def bulk_soft_delete(model, list_id, label):
+    """
+    Ẩn (is_active=False) nhiều bản ghi: 1 query lấy trạng thái hiện tại và 1 update_many cho các id còn active.
+    Kết quả giữ format {'success': [...], 'failure': [...]} như trước.
+    """
+    ids = [int(item_id) for item_id in list_id]
+    is_active_by_id = dict(model.objects.filter(id__in=ids).values_list('id', 'is_active'))
+
+    success = []
+    failure = []
+    to_deactivate = []
+    for item_id, raw_id in zip(ids, list_id):
+        if item_id not in is_active_by_id:
+            failure.append({'id': raw_id, 'error': f'{label} not found'})
+        elif not is_active_by_id[item_id]:
+            failure.append({'id': raw_id, 'error': f'{label} already deleted'})
+        else:
+            success.append(raw_id)
+            to_deactivate.append(item_id)
+            is_active_by_id[item_id] = False
+    if to_deactivate:
+        model.objects.filter(id__in=to_deactivate).update(is_active=False)
+    return {
+        'success': success,
+        'failure': failure,
+    }
+
+
+def not_modified(request, etag):
+    """
+    Trả về response 304 nếu If-None-Match của client khớp ETag hiện tại, ngược lại trả về None.
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return None
+
+
+def product_etag(product_id, version, details):
+    # Response chi tiết có nhúng category nên ETag gồm cả version của categories
+    return f'"product-{product_id}-{version or 0}-{category_cache.get_version()}-{"d" if details else "n"}"'
 
 
 class ProductDetailView(APIView):
     def get(self, request, id):
         details = bool(request.query_params.get('details', False))
+        if 'If-None-Match' in request.headers:
+            # Chỉ đọc version để so ETag, chưa load document hay serialize
+            version = repository.get_product_version(int(id))
+            if version is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            cached = not_modified(request, product_etag(int(id), version, details))
+            if cached:
+                return cached
+        serializer_class = ProductSerializer if details else ProductSerializerNotDetail
         try:
-            product = Product.objects.get(id=int(id))
-            if details:
-                serializer = ProductSerializer(product, context={'request': request})
-            else:
-                serializer = ProductSerializerNotDetail(product, context={'request': request})
-            return Response(serializer.data)
-        except Product.DoesNotExist:
+            fields = parse_fields(request.query_params.get('fields'), serializer_class)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        product = repository.get_product(int(id), fields=model_fields_for(fields))
+        if product is None:
             return Response(status=status.HTTP_404_NOT_FOUND)
+        data = fast_serializers.serialize_product(product, serializer_class, request, fields)
+        return Response(data, headers={'ETag': product_etag(product.id, product.version, details)})
 
     @atomic
     def patch(self, request, id):
@@ -52,27 +113,181 @@ class ProductDetailView(APIView):
 
 
 
+class ProductBatchView(APIView):
+    # Giới hạn số id mỗi lần gọi để query và payload không phình to
+    MAX_IDS = 100
+
+    def get(self, request):
+        details = bool(request.query_params.get('details', False))
+        # include_inactive=1: trả cả product đã ẩn trong items (vẫn liệt kê trong inactive), vd. cho giỏ hàng
+        include_inactive = request.query_params.get('include_inactive') in ('1', 'true', 'True')
+        raw_ids = request.query_params.get('ids', '')
+        try:
+            # Bỏ id trùng nhưng giữ nguyên thứ tự caller gửi lên
+            ids = list(dict.fromkeys(int(product_id) for product_id in raw_ids.split(',') if product_id.strip()))
+        except ValueError:
+            return Response({'error': 'ids must be a comma separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.MAX_IDS:
+            return Response({'error': f'At most {self.MAX_IDS} ids per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer_class = ProductSerializer if details else ProductSerializerNotDetail
+        try:
+            fields = parse_fields(request.query_params.get('fields'), serializer_class)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = repository.products_by_ids(ids, fields=model_fields_for(fields))
+        products = [found[product_id] for product_id in ids
+                    if product_id in found and (include_inactive or found[product_id].is_active)]
+        missing = [product_id for product_id in ids if product_id not in found]
+        inactive = [product_id for product_id in ids if product_id in found and not found[product_id].is_active]
+
+        return Response({
+            'items': fast_serializers.serialize_products(products, serializer_class, request, fields),
+            'missing': missing,
+            'inactive': inactive,
+        }, status=status.HTTP_200_OK)
+
+
 class ProductListView(APIView):
     def get(self, request):
+        # ETag theo version của category đang lọc (hoặc cả collection), đọc từ bộ nhớ nên 304 không cần tới database
+        try:
+            scope = list_cache.version_scope(request.query_params)
+        except ValueError:
+            return Response({'error': 'Invalid query parameters'}, status=status.HTTP_400_BAD_REQUEST)
+        products_version = versions.products_version(scope)
+        etag = f'"products-{versions.ALL_CATEGORIES if scope is None else scope}-{products_version}-' \
+               f'{category_cache.get_version()}"'
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        if request.query_params.get('query'):
+            response = self._list(request)
+        else:
+            # Trang danh sách không có từ khoá tìm kiếm được cache, key theo version nên product đổi là bỏ cache
+            try:
+                key = list_cache.cache_key(request, products_version)
+            except ValueError:
+                return Response({'error': 'Invalid query parameters'}, status=status.HTTP_400_BAD_REQUEST)
+            response = list_cache.get_or_build(key, lambda: self._list(request))
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+
+    def _list(self, request):
         query = request.query_params.get('query', '')
-        category_id = request.query_params.get('category_id', None)
+        sort = request.query_params.get('sort', '')
         per_page = int(request.query_params.get('per_page', 10))
         page = int(request.query_params.get('page', 1))
+        try:
+            filters = facets.parse_filters(request.query_params)
+        except ValueError:
+            return Response({'error': 'Invalid filter'}, status=status.HTTP_400_BAD_REQUEST)
+        if sort not in facets.SORTS:
+            return Response({'error': 'Invalid sort'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fields = parse_fields(request.query_params.get('fields'), ProductSerializer)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Lấy danh sách sản phẩm active từ database
-        products = Product.objects.filter(name__icontains=query).filter(is_active__in=[True]).order_by('id')
-        if category_id:
-            products = products.filter(category_id=int(category_id))
+        products = repository.ProductQuery({'is_active': True, **facets.mongo_match(filters)}, facets.SORTS[sort],
+                                           fields=model_fields_for(fields))
+
+        ranked_ids = None
+        search_ids = None
+        if query:
+            # Tìm qua inverted index rồi chỉ giữ các id còn active / thoả bộ lọc
+            result = search.search(query)
+            # Facet tự áp bộ lọc (trừ bộ lọc của chính nó) nên tính trên kết quả tìm kiếm chưa lọc
+            search_ids = ranked_ids = result.ids
+            if sort:
+                # Có sort thì xếp kết quả theo sort thay vì theo thứ hạng
+                ranked_ids = products.ids(ranked_ids)
+            else:
+                visible_ids = set(products.ids(ranked_ids))
+                ranked_ids = [product_id for product_id in ranked_ids if product_id in visible_ids]
+
+        if 'after' in request.query_params:
+            scores = result.scores if query and not sort else None
+            response = self._cursor_page(request, products, ranked_ids, per_page, sort, fields, scores)
+        else:
+            if ranked_ids is not None:
+                paginator = Paginator(ranked_ids, per_page)
+                page_obj = paginator.get_page(page)
+                found = products.in_bulk(list(page_obj))
+                items = [found[product_id] for product_id in page_obj]
+            else:
+                paginator = Paginator(products, per_page)
+                items = paginator.get_page(page)
 
-        paginator = Paginator(products, per_page)
-        page_obj = paginator.get_page(page)
+            response = Response({
+                'items': fast_serializers.serialize_products(items, ProductSerializer, request, fields),
+                'per_page': per_page,
+                'page': page,
+                'total_pages': paginator.num_pages
+            }, status=status.HTTP_200_OK)
 
-        serializer = ProductSerializer(page_obj, many=True, context={'request': request})
+        if query and response.status_code == status.HTTP_200_OK:
+            # Từ khoá quá phổ biến: chỉ xếp hạng trong search.MAX_CANDIDATES ứng viên, báo cho client biết
+            response.data['truncated'] = result.truncated
+        if request.query_params.get('facets') in ('1', 'true', 'True') and response.status_code == status.HTTP_200_OK:
+            response.data['facets'] = facets.compute_facets(filters, search_ids)
+        return response
+
+    def _cursor_page(self, request, products, ranked_ids, per_page, sort, fields, scores=None):
+        """
+        Phân trang theo cursor: seek trên id (id > id cuối trang trước, hoặc id < khi sort=newest),
+        không skip và không count. Lấy dư 1 bản ghi để biết còn trang sau hay không.
+        """
+        if ranked_ids is None and sort not in ('', 'newest'):
+            return Response({'error': 'Cursor pagination only supports default and newest sort'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        after = request.query_params.get('after')
+        try:
+            if ranked_ids is not None:
+                last_score, last_id = decode_rank_cursor(after) if after else (None, None)
+            else:
+                last_id = decode_cursor(after) if after else None
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if ranked_ids is not None:
+            if last_id is None:
+                start = 0
+            elif scores is not None and last_score is not None:
+                # Xếp theo thứ hạng (điểm giảm dần, id tăng dần): seek tới phần tử đầu tiên sau (điểm, id) của cursor,
+                # đúng cả khi product đó không còn trong kết quả
+                start = next((index for index, product_id in enumerate(ranked_ids)
+                              if (-scores[product_id], product_id) > (-last_score, last_id)), len(ranked_ids))
+            elif last_id in ranked_ids:
+                start = ranked_ids.index(last_id) + 1
+            else:
+                # Xếp theo ?sort= mà product cuối trang đã không còn: không biết vị trí, không quay về trang đầu
+                return Response({'error': 'Stale cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            page_ids = ranked_ids[start:start + per_page + 1]
+            found = products.in_bulk(page_ids)
+            items = [found[product_id] for product_id in page_ids]
+        else:
+            if last_id is not None:
+                products = products.seek(last_id)
+            items = products[:per_page + 1]
+
+        has_next = len(items) > per_page
+        items = items[:per_page]
+        if not has_next:
+            next_cursor = None
+        elif ranked_ids is not None:
+            next_cursor = encode_rank_cursor(scores[items[-1].id] if scores is not None else None, items[-1].id)
+        else:
+            next_cursor = encode_cursor(items[-1].id)
         return Response({
-            'items': serializer.data,
+            'items': fast_serializers.serialize_products(items, ProductSerializer, request, fields),
             'per_page': per_page,
-            'page': page,
-            'total_pages': paginator.num_pages
+            'next': next_cursor,
         }, status=status.HTTP_200_OK)
 
     @atomic
@@ -88,35 +303,23 @@ class ProductListView(APIView):
     def delete(self, request):
         permission_classes = [IsAdminRole]
 
-        list_product_id = request.data
-        success = []
-        failure = []
-
-        for product_id in list_product_id:
-            try:
-                product = Product.objects.get(id=int(product_id))
-                if product.is_active == False:
-                    failure.append({'id': product_id, 'error': 'Product already deleted'})
-                    continue
-                product.is_active = False
-                product.save()
-                success.append(product_id)
-            except Product.DoesNotExist:
-                failure.append({'id': product_id, 'error': 'Product not found'})
-        response = {
-            'success': success,
-            'failure': failure,
-        }
+        response = bulk_soft_delete(Product, request.data, 'Product')
+        if response['success']:
+            deleted_ids = [int(product_id) for product_id in response['success']]
+            versions.bump_products(deleted_ids)
+            events.record({product_id: {'is_active': False} for product_id in deleted_ids})
         return Response(response, status=status.HTTP_202_ACCEPTED)
 
 
 class CategoryListView(APIView):
     def get(self, request):
-        categories = Category.objects.all().order_by('id')
-        categories = categories.filter(is_active__in=[True])
+        etag = f'"categories-{category_cache.get_version()}"'
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        categories = category_cache.get_active_categories()
 
-        serializer = CategorySerializer(categories, many=True)
-        return Response(serializer.data)
+        return Response(fast_serializers.serialize_categories(categories), headers={'ETag': etag})
 
     @atomic
     def post(self, request):
@@ -127,6 +330,7 @@ class CategoryListView(APIView):
             data['id'] = request.data['id']
         try:
             category = Category.create(**data)
+            category_cache.invalidate()
             return Response(CategorySerializer(category).data, status=status.HTTP_201_CREATED)
         except ValueError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -134,25 +338,9 @@ class CategoryListView(APIView):
     @atomic
     def delete(self, request):
         permission_classes = [IsAdminRole]
-        list_category_id = request.data
-        print(list_category_id)
-        success = []
-        failure = []
-        for category_id in list_category_id:
-            try:
-                category = Category.objects.get(id=int(category_id))
-                if category.is_active == False:
-                    failure.append({'id': category_id, 'error': 'Category already deleted'})
-                    continue
-                category.is_active = False
-                category.save()
-                success.append(category_id)
-            except Category.DoesNotExist:
-                failure.append({'id': category_id, 'error': 'Category not found'})
-        response = {
-            'success': success,
-            'failure': failure,
-        }
+        response = bulk_soft_delete(Category, request.data, 'Category')
+        if response['success']:
+            category_cache.invalidate()
         return Response(response, status=status.HTTP_202_ACCEPTED)
 
 
@@ -164,6 +352,7 @@ class CategoryDetailView(APIView):
         try:
             category = Category.objects.get(id=int(id))
             category.delete()
+            category_cache.invalidate()
             return Response(status=status.HTTP_202_ACCEPTED)
         except Category.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
@@ -178,6 +367,7 @@ class CategoryDetailView(APIView):
                                             partial=True)
             if serializer.is_valid():
                 serializer.save()
+                category_cache.invalidate()
                 return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Category.DoesNotExist:
@@ -187,13 +377,135 @@ class CategoryDetailView(APIView):
 class ProductStockView(APIView):
     permission_classes = [IsAdminRole]
 
-    @atomic
     def patch(self, request, id):
         try:
-            product = Product.objects.get(id=int(id))
-            change = request.data.get('change', 0)
-            product.stock += int(change)
-            product.save()
-            return Response(status=status.HTTP_202_ACCEPTED)
-        except Product.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            change = int(request.data.get('change', 0))
+        except (TypeError, ValueError):
+            return Response({'error': 'change must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if reservations.change_stock(int(id), change) is None:
+            if not Product.objects.filter(id=int(id)).exists():
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            return Response({'error': 'Không đủ hàng trong kho'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+
+class StockReservationView(APIView):
+    permission_classes = [IsAuthenticatedService]
+
+    def post(self, request, id):
+        try:
+            quantity = int(request.data.get('quantity', 0))
+            ttl = int(request.data['ttl']) if request.data.get('ttl') not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response({'error': 'quantity and ttl must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity <= 0:
+            return Response({'error': 'quantity must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        # ttl <= 0 sẽ tạo reservation đã hết hạn ngay, ttl quá lớn giữ hàng gần như vĩnh viễn
+        if ttl is not None and not 0 < ttl <= settings.STOCK_RESERVATION_MAX_TTL:
+            return Response({'error': f'ttl must be between 1 and {settings.STOCK_RESERVATION_MAX_TTL} seconds'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        reservation = reservations.reserve(int(id), quantity, ttl)
+        if reservation is None:
+            if not Product.objects.filter(id=int(id), is_active__in=[True]).exists():
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            return Response({'error': 'Không đủ hàng trong kho'}, status=status.HTTP_409_CONFLICT)
+        return Response(StockReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+
+class StockReservationCommitView(APIView):
+    permission_classes = [IsAuthenticatedService]
+
+    def post(self, request, reservation_id):
+        if not reservations.commit(reservation_id):
+            return Response({'error': 'Reservation not found, expired or already closed'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+
+class StockReservationReleaseView(APIView):
+    permission_classes = [IsAuthenticatedService]
+
+    def post(self, request, reservation_id):
+        if not reservations.release(reservation_id):
+            return Response({'error': 'Reservation not found or already closed'}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+
+class ProductEventFeedView(APIView):
+    """
+    Feed thay đổi của product cho service khác: đọc các event có offset > after.
+    wait > 0 thì long-poll tối đa `wait` giây khi chưa có event mới.
+    """
+    permission_classes = [IsAuthenticatedService]
+    MAX_LIMIT = 1000
+
+    def get(self, request):
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = min(int(request.query_params.get('limit', 100)), self.MAX_LIMIT)
+            wait = min(float(request.query_params.get('wait', 0)), settings.PRODUCT_EVENT_MAX_WAIT)
+        except ValueError:
+            return Response({'error': 'after, limit and wait must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit <= 0:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = events.wait_for(after, limit, wait) if wait > 0 else events.read(after, limit)
+        return Response({
+            'events': found,
+            'next': found[-1]['offset'] if found else after,
+        }, status=status.HTTP_200_OK)
+
+
+class ProductExportView(APIView):
+    """
+    Export catalog dạng NDJSON (mỗi dòng 1 product, cùng format với API chi tiết), stream dần
+    theo từng batch nên bộ nhớ không tăng theo số product.
+    - Mặc định: toàn bộ product đang active.
+    - ?updated_since=<offset>: chỉ các product có thay đổi sau offset đó trong feed /product/events,
+      gồm cả product đã bị ẩn (is_active=false) để bên nhận xoá đi.
+    Header X-Events-Offset là offset để truyền vào updated_since ở lần export sau.
+    """
+    permission_classes = [IsAdminRole]
+    BATCH_SIZE = 500
+
+    def get(self, request):
+        updated_since = request.query_params.get('updated_since')
+        try:
+            updated_since = int(updated_since) if updated_since else None
+        except ValueError:
+            return Response({'error': 'updated_since must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Lấy offset trước khi đọc dữ liệu: thay đổi xảy ra trong lúc export sẽ có ở lần sau
+        events_offset = Counter.get_current_sequence(events.OFFSET_KEY)
+        if updated_since is None:
+            batches = repository.iter_product_batches({'is_active': True}, self.BATCH_SIZE)
+        else:
+            batches = self._changed_batches(events.changed_product_ids(updated_since))
+
+        response = StreamingHttpResponse(self._lines(request, batches), content_type='application/x-ndjson')
+        response['X-Events-Offset'] = str(events_offset)
+        return response
+
+    def _changed_batches(self, product_ids):
+        product_ids = iter(product_ids)
+        while True:
+            chunk = list(itertools.islice(product_ids, self.BATCH_SIZE))
+            if not chunk:
+                return
+            found = repository.products_by_ids(chunk)
+            yield [found[product_id] for product_id in chunk if product_id in found]
+
+    def _lines(self, request, batches):
+        for batch in batches:
+            # Ảnh của cả batch lấy trong 1 query, category từ cache
+            data = fast_serializers.serialize_products(batch, ProductSerializer, request, image_variant='large')
+            yield ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in data)
+
+
+class HttpClientMetricsView(APIView):
+    """Số liệu connection pool và circuit breaker của HTTP client trong process này."""
+    permission_classes = [IsAuthenticatedService]
+
+    def get(self, request):
+        return Response(http_client.metrics(), status=status.HTTP_200_OK)
@@ -0,0 +1,16 @@
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class ServiceAccessToken(AccessToken):
+    """
+    Access token có sẵn id và role của user để Cart / Product Service tự xác thực token
+    (kiểm tra chữ ký bằng JWT_SIGNING_KEY) mà không phải gọi lại /get-user-info.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['id'] = user.id
+        token['username'] = user.username
+        token['role'] = {'id': user.role.id, 'name': user.role.name}
+        return token
@@ -6,9 +6,9 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.hashers import make_password, check_password
 from .models import User, Name, Address, Ward, District, City, Role
+from .tokens import ServiceAccessToken
 from .serializers import UserSerializer, UserUpdateSerializer, AddressSerializer, WardSerializer, DistrictSerializer, CitySerializer
 
 class LoginView(APIView):
@@ -22,9 +22,9 @@ class LoginView(APIView):
         try:
             user = User.objects.get(username=username)
             if check_password(password, user.password):
-                refresh = RefreshToken.for_user(user)
+                token = ServiceAccessToken.for_user(user)
                 return Response({
-                    'token': str(refresh.access_token)
+                    'token': str(token)
                 }, status=status.HTTP_200_OK)
             else:
                 return Response({'error': 'Invalid username or password'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -58,9 +58,9 @@ class RegisterView(APIView):
             role=role
         )
 
-        refresh = RefreshToken.for_user(user)
+        token = ServiceAccessToken.for_user(user)
         return Response({
-            'token': str(refresh.access_token)
+            'token': str(token)
         }, status=status.HTTP_200_OK)
 
 class GetUserInfoView(APIView):
@@ -135,6 +135,11 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=0),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Khoá ký token dùng chung với Cart / Product Service để các service đó tự xác thực token.
+    # Với RS256: JWT_SIGNING_KEY là private key, các service khác dùng public key (JWT_VERIFYING_KEY)
+    'ALGORITHM': os.getenv('JWT_ALGORITHM', 'HS256'),
+    'SIGNING_KEY': os.getenv('JWT_SIGNING_KEY', SECRET_KEY),
+    'VERIFYING_KEY': os.getenv('JWT_VERIFYING_KEY', ''),
 }
 
 